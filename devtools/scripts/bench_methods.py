@@ -0,0 +1,65 @@
+"""
+Compares steep, cg and l-bfgs on the same systems: steps, wall time
+and whether Fmax reached the tolerance, next to the integrator the
+"auto" method picks. Run on systems of growing size, the atom count
+where cg overtakes l-bfgs is the _lbfgs_max_atoms of select_integrator,
+which is unset until measured.
+
+Usage: python bench_methods.py [--system water-mol.json:water-ff.json]
+                               [--tol 10] [--steps 5000]
+"""
+import argparse
+
+import mm_data
+import mmelemental
+from mmic_optim import OptimInput
+from mmic_optim_gmx.components import OptimGmxComponent
+from mmic_optim_gmx.util import select_integrator
+
+methods = ("steepest descent", "conjugate gradient", "l-bfgs")
+
+
+def make_input(mol_key: str, ff_key: str, method: str, tol: float, steps: int):
+    mol = mmelemental.models.Molecule.from_file(mm_data.mols[mol_key])
+    ff = mmelemental.models.ForceField.from_file(mm_data.ffs[ff_key])
+    return OptimInput(
+        engine="gmx",
+        schema_name="bench",
+        schema_version=1.0,
+        molecule={"mol": mol},
+        forcefield={"mol": ff},
+        boundary=("periodic",) * 6,
+        max_steps=steps,
+        tol=tol,
+        step_size=0.01,
+        method=method,
+        long_forces={"method": "PME"},
+        short_forces={"method": "cutoff"},
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--system",
+        action="append",
+        help="mm_data molecule and force field keys as mol:ff",
+    )
+    parser.add_argument("--tol", type=float, default=10.0)
+    parser.add_argument("--steps", type=int, default=5000)
+    args = parser.parse_args()
+
+    for system in args.system or ["water-mol.json:water-ff.json"]:
+        mol_key, ff_key = system.split(":")
+        print(system)
+        for method in methods:
+            inputs = make_input(mol_key, ff_key, method, args.tol, args.steps)
+            log = OptimGmxComponent.compute(
+                inputs, extras={"trajectory": "none"}
+            ).extras["log"]
+            print(
+                f"{method:>20}: {log['nsteps'] or 0:6d} steps "
+                f"{log['wall_time'] or 0:8.2f} s converged={log['converged']}"
+            )
+        natoms = len(inputs.molecule["mol"].symbols)
+        print(f"{'auto':>20}: {select_integrator(natoms)} for {natoms} atoms")
@@ -0,0 +1,89 @@
+"""
+Compares the throughput of OptimGmxComponent.compute_batch with the
+size-aware scheduler against two fixed splits: every minimization gets
+all the cores and they run one after the other ("all cores"), or every
+minimization gets one core and as many run at a time ("one core each").
+Small systems favor many runs side by side, large ones many threads per
+run; the mixed batch shows whether the scheduler gets both right. The
+atoms per thread of threads_per_run are provisional until tuned with it.
+
+Usage: python bench_scheduler.py [--runs 64] [--large 2] [--waters 3000]
+                                 [--steps 500]
+"""
+import argparse
+import time
+
+import mm_data
+import mmelemental
+from mmic_optim import OptimInput
+from mmic_optim_gmx.components import OptimGmxComponent
+from mmic_optim_gmx.util import available_cores, pack_molecules
+
+# nm between packed water molecules, about the density of liquid water
+_water_gap = 0.25
+
+
+def make_input(nwaters: int, steps: int) -> OptimInput:
+    """A box of ``nwaters`` water molecules on a grid."""
+    mol = mmelemental.models.Molecule.from_file(mm_data.mols["water-mol.json"])
+    ff = mmelemental.models.ForceField.from_file(mm_data.ffs["water-ff.json"])
+    groups, box = pack_molecules([[mol]] * nwaters, _water_gap)
+    keys = [f"w{i}" for i in range(nwaters)]
+    return OptimInput(
+        engine="gmx",
+        schema_name="bench",
+        schema_version=1.0,
+        molecule=dict(zip(keys, (group[0] for group in groups))),
+        forcefield=dict.fromkeys(keys, ff),
+        boundary=("periodic",) * 6,
+        cell=(0.0, 0.0, 0.0, *(box * 10.0)),  # nm to angstrom
+        max_steps=steps,
+        tol=1e-6,
+        step_size=0.01,
+        method="steepest descent",
+        long_forces={"method": "PME"},
+        short_forces={"method": "cutoff"},
+    )
+
+
+def bench(label: str, inputs, **kwargs) -> float:
+    natoms = sum(len(mol.symbols) for inp in inputs for mol in inp.molecule.values())
+    start = time.perf_counter()
+    results = OptimGmxComponent.compute_batch(inputs, **kwargs)
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(res, Exception) for res in results)
+    rate = len(inputs) / elapsed
+    print(
+        f"{label:>16}: {elapsed:8.2f} s {rate:8.2f} runs/s "
+        f"{natoms / elapsed:10.0f} atoms/s ({failed} failed)"
+    )
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=64, help="small systems")
+    parser.add_argument("--large", type=int, default=2, help="large systems")
+    parser.add_argument("--waters", type=int, default=3000, help="large size")
+    parser.add_argument("--steps", type=int, default=500)
+    args = parser.parse_args()
+
+    ncores = available_cores()
+    small = [make_input(1, args.steps) for _ in range(args.runs)]
+    large = [make_input(args.waters, args.steps) for _ in range(args.large)]
+    batches = {
+        f"{args.runs} x 1 water": small,
+        f"{args.large} x {args.waters} waters": large,
+        "mixed": large[: len(large) // 2] + small + large[len(large) // 2 :],
+    }
+    print(f"Minimizations of {args.steps} steps on {ncores} cores")
+
+    for name, inputs in batches.items():
+        print(name)
+        times = {
+            "all cores": bench("all cores", inputs, config={"ncores": ncores}),
+            "one core each": bench("one core each", inputs, max_workers=ncores),
+            "size-aware": bench("size-aware", inputs),
+        }
+        best = min(times, key=times.get)
+        print(f"{'fastest':>16}: {best}")
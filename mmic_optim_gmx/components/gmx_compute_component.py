@@ -1,18 +1,50 @@
 # Import models
 from ..models import ComputeGmxInput, ComputeGmxOutput
+from ..util import (
+    random_file,
+    gmx_version,
+    FileCache,
+    default_cache_dir,
+    read_edr,
+    write_trr,
+    write_gro_coords,
+    TrrFile,
+    parse_em_steps,
+    parse_em_log,
+    EmProgress,
+    task_config,
+    mdrun_threads,
+    available_cores,
+    CoreAllocator,
+    drive,
+    remaining,
+    tail,
+    Steps,
+)
 
 # Import components
-from mmic_cmd.components import CmdComponent
 from mmic.components.blueprints import GenericComponent
 
-from typing import Dict, Any, List, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional, ContextManager
+from contextlib import nullcontext
 from pathlib import Path
+import numpy
 import os
+import shlex
 import shutil
 import tempfile
+import time
 
 
 __all__ = ["ComputeGmxComponent"]
+# Minimizations ignore mdrun -maxh, so runs with a deadline are killed and,
+# without a trajectory, write coordinates every _recovery_stride steps to
+# recover the last ones
+_recovery_stride = 100
+# Launcher of the MPI mdrun of ensembles unless the config has
+# mpiexec_command, and the files mdrun -multidir writes in each directory
+_mpiexec = "mpiexec -n {total_ranks}"
+_multidir_files = ("confout.gro", "ener.edr", "md.log", "traj.trr")
 
 
 class ComputeGmxComponent(GenericComponent):
@@ -33,6 +65,24 @@ class ComputeGmxComponent(GenericComponent):
         timeout: Optional[int] = None,
     ) -> Tuple[bool, ComputeGmxOutput]:
 
+        return True, drive(self.steps(inputs, timeout))
+
+    def steps(self, inputs: ComputeGmxInput, timeout: Optional[float] = None) -> Steps:
+        """
+        Yields the grompp (unless cached) and mdrun commands, then returns
+        the parsed ComputeGmxOutput. With a ``timeout`` in seconds, grompp
+        and mdrun are killed when it expires, and a killed mdrun returns
+        the last structure of its trajectory, see :meth:`recover`. With
+        ``extras["trajectory"]`` "none" that trajectory is private and
+        written every ``_recovery_stride`` steps, otherwise it keeps the
+        nstxout of the mdp file.
+
+        A callable ``extras["progress"]`` is called with a dict of "step",
+        "epot" and "fmax" for every step mdrun reports while it runs. If
+        it raises, mdrun is killed and the exception propagates, which
+        lets callers abort a minimization early.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
         # Call gmx pdb2gmx, mdrun, etc. here
         if isinstance(inputs, dict):
             inputs = self.input()(**inputs)
@@ -44,7 +94,9 @@ class ComputeGmxComponent(GenericComponent):
             inputs.forcefield,
         )
 
-        tpr_file = tempfile.NamedTemporaryFile(suffix=".tpr")
+        tpr_file = random_file(suffix=".tpr")
+        if deadline and (self.extras or {}).get("trajectory") == "none":
+            self.write_frames(mdp_file, _recovery_stride)
 
         input_model = {
             "proc_input": proc_input,
@@ -54,19 +106,292 @@ class ComputeGmxComponent(GenericComponent):
             "tpr_file": tpr_file,
         }
 
-        clean_files, cmd_input_grompp = self.build_input_grompp(input_model)
-        rvalue = CmdComponent.compute(cmd_input_grompp)
-        self.cleanup(clean_files)  # Del mdp and top file in the working dir
-        self.cleanup([inputs.scratch_dir])
-        tpr_dir = str(rvalue.scratch_directory)
-
+        # grompp output only depends on its input files and the gmx version
+        tpr_cache, cached_tpr = self.tpr_cache(), None
+        if tpr_cache:
+            tpr_key = tpr_cache.key(
+                *(Path(fname).read_bytes() for fname in (mdp_file, gro_file, top_file)),
+                gmx_version(proc_input.engine),
+            )
+            cached_tpr = tpr_cache.get(tpr_key)
+
+        clean_dirs = [inputs.scratch_dir] if inputs.scratch_dir else []
+        if cached_tpr:
+            shutil.copyfile(cached_tpr, tpr_file)
+            self.cleanup([mdp_file, top_file])
+        else:
+            clean_files, cmd_input_grompp = self.build_input_grompp(
+                input_model, config=(self.extras or {}).get("config")
+            )
+            rvalue = yield {**cmd_input_grompp, "timeout": remaining(deadline)}
+            if tpr_cache:
+                tpr_cache.put(tpr_key, tpr_file)
+            self.cleanup(clean_files)  # Del mdp and top file in the working dir
+            clean_dirs.append(str(rvalue["scratch_directory"]))
+        self.cleanup(clean_dirs)
+
+        config = task_config((self.extras or {}).get("config"))
+        # The frames of a run that may be killed go outside its scratch
+        # directory, which is removed with the process
+        frames_dir, trr_file = None, None
+        if deadline:
+            frames_dir = tempfile.mkdtemp(dir=config.get("scratch_directory"))
+            trr_file = os.path.join(frames_dir, "traj.trr")
         input_model = {"proc_input": proc_input, "tpr_file": tpr_file}
-        cmd_input_mdrun = self.build_input_mdrun(input_model)
-        rvalue = CmdComponent.compute(cmd_input_mdrun)
+        progress = (self.extras or {}).get("progress")
+        try:
+            with self.allocate_cores(config, proc_input) as pinning:
+                cmd_input_mdrun = self.build_input_mdrun(
+                    {**input_model, "trr_file": trr_file},
+                    config={**config, **pinning},
+                )
+                rvalue = yield {
+                    **cmd_input_mdrun,
+                    "timeout": remaining(deadline),
+                    "stderr_callback": EmProgress(progress) if progress else None,
+                }
+        except TimeoutError:
+            output = self.recover(gro_file, frames_dir, proc_input)
+            self.cleanup([tpr_file, gro_file])
+            return output
+        except BaseException:
+            self.cleanup([tpr_file, gro_file] + ([frames_dir] if frames_dir else []))
+            raise
         self.cleanup([tpr_file, gro_file])
-        self.cleanup([tpr_dir])
 
-        return True, self.parse_output(rvalue.dict(), proc_input)
+        if trr_file:
+            if (self.extras or {}).get("trajectory") != "none":
+                scratch_trr = os.path.join(str(rvalue["scratch_directory"]), "traj.trr")
+                shutil.move(trr_file, scratch_trr)
+                rvalue["outfiles"] = {**rvalue["outfiles"], "traj.trr": scratch_trr}
+            self.cleanup([frames_dir])
+
+        return self.parse_output(rvalue, proc_input)
+
+    @staticmethod
+    def write_frames(mdp_file: str, nstxout: int):
+        """
+        Makes the mdp file write coordinates at least every ``nstxout``
+        steps, keeping a smaller nonzero nstxout. Only used for the private
+        trajectory that recovers runs killed at their deadline, so that a
+        trajectory asked for keeps its stride.
+        """
+        with open(mdp_file) as fp:
+            lines = fp.read().splitlines()
+        options = {
+            key.strip(): val.strip()
+            for key, val in (line.split("=", 1) for line in lines if "=" in line)
+        }
+        if 0 < int(options.get("nstxout", 0)) <= nstxout:
+            return
+        lines = [line for line in lines if line.split("=")[0].strip() != "nstxout"]
+        with open(mdp_file, "w") as fp:
+            for line in lines + [f"nstxout = {nstxout}"]:
+                fp.write(f"{line}\n")
+
+    def recover(
+        self, gro_file: str, frames_dir: str, proc_input: "OptimInput"
+    ) -> ComputeGmxOutput:
+        """
+        Returns the output of an mdrun killed at its deadline, with
+        ``timed_out`` set: the last coordinates it wrote to traj.trr in
+        ``frames_dir``, or the starting structure ``gro_file`` if it wrote
+        none. The energies and the log are lost with the process.
+        """
+        trr_file = os.path.join(frames_dir, "traj.trr")
+        final_gro = os.path.join(frames_dir, "confout.gro")
+        trr = TrrFile(trr_file) if os.path.isfile(trr_file) else []
+        frames = [frame for frame in range(len(trr)) if trr.has_field(frame, "x")]
+        if frames:
+            frame = trr.read_frame(frames[-1], ("box", "x"))
+            write_gro_coords(gro_file, final_gro, frame["x"], frame.get("box"))
+        else:
+            shutil.copyfile(gro_file, final_gro)
+
+        keep = frames and (self.extras or {}).get("trajectory") != "none"
+        if not keep:
+            self.cleanup([trr_file])
+        return self.output()(
+            proc_input=proc_input,
+            molecule=final_gro,
+            trajectory=trr_file if keep else None,
+            scratch_dir=frames_dir,
+            timed_out=True,
+        )
+
+    def ensemble_steps(
+        self, inputs: List[ComputeGmxInput], timeout: Optional[float] = None
+    ) -> Steps:
+        """
+        Yields one grompp per input, run concurrently, and a single
+        ``mdrun -multidir`` minimizing all of them as a multi-simulation,
+        then returns the ComputeGmxOutputs in the order of ``inputs``. The
+        inputs may share the mdp and top files, which are removed once.
+
+        -multidir needs an MPI build of gmx, ``extras["mpi_engine"]``
+        (default: "gmx_mpi"), started with ``config["mpiexec_command"]``
+        (default: "mpiexec -n {total_ranks}") with one rank per input and
+        the cores split between them as OpenMP threads. grompp and mdrun
+        are killed when the ``timeout`` expires, which fails the whole
+        ensemble; progress is not reported.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        inputs = [
+            self.input()(**inp) if isinstance(inp, dict) else inp for inp in inputs
+        ]
+        config = task_config((self.extras or {}).get("config"))
+        dirs = [tempfile.mkdtemp(dir=config.get("scratch_directory")) for _ in inputs]
+
+        cmd_inputs, clean_files = [], []
+        for inp, path in zip(inputs, dirs):
+            input_model = {
+                "proc_input": inp.proc_input,
+                "mdp_file": inp.mdp_file,
+                "gro_file": inp.molecule,
+                "top_file": inp.forcefield,
+                "tpr_file": os.path.join(path, "topol.tpr"),
+            }
+            files, cmd_input = self.build_input_grompp(input_model, config=config)
+            cmd_inputs.append({**cmd_input, "timeout": remaining(deadline)})
+            clean_files.extend([*files, inp.molecule])
+            if inp.scratch_dir:
+                clean_files.append(inp.scratch_dir)
+        try:
+            rvalues = yield cmd_inputs
+            self.cleanup(
+                [*dict.fromkeys(clean_files)]
+                + [str(rvalue["scratch_directory"]) for rvalue in rvalues]
+            )
+
+            proc_input = inputs[0].proc_input
+            input_model = {"proc_input": proc_input, "dirs": dirs}
+            cmd_input = self.build_input_multidir(input_model, config=config)
+            rvalue = yield {**cmd_input, "timeout": remaining(deadline)}
+            self.cleanup(
+                [str(rvalue["scratch_directory"])]
+                + [os.path.join(path, "topol.tpr") for path in dirs]
+            )
+
+            # A traj.trr left by -o is only kept if it is going to be read
+            fnames = _multidir_files
+            if (self.extras or {}).get("trajectory") == "none":
+                fnames = [fname for fname in fnames if fname != "traj.trr"]
+            outputs = []
+            for inp, path in zip(inputs, dirs):
+                outfiles = {
+                    fname: os.path.join(path, fname)
+                    for fname in fnames
+                    if os.path.isfile(os.path.join(path, fname))
+                }
+                if "confout.gro" not in outfiles:
+                    raise RuntimeError(f"mdrun -multidir failed:\n{rvalue['stderr']}")
+                output = {"outfiles": outfiles, "scratch_directory": path}
+                outputs.append(self.parse_output(output, inp.proc_input))
+        except BaseException:
+            self.cleanup(dirs)  # Outputs own the directories on success
+            raise
+        return outputs
+
+    def rerun_steps(
+        self,
+        inputs: ComputeGmxInput,
+        frames: numpy.ndarray,
+        box: Optional[numpy.ndarray] = None,
+        timeout: Optional[float] = None,
+    ) -> Steps:
+        """
+        Writes ``frames`` (nframes, natoms, 3) in nm with the (3, 3) ``box``
+        in nm to one trajectory and yields the grompp and ``mdrun -rerun``
+        commands computing the energies of every frame in a single run.
+        The mdp file must be one for reruns, see
+        :meth:`PrepGmxComponent.mdp_options`. Returns the per-frame energy
+        terms read from the .edr, see :func:`read_edr`. mdrun is killed
+        once ``timeout`` seconds have passed.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        if isinstance(inputs, dict):
+            inputs = self.input()(**inputs)
+
+        proc_input = inputs.proc_input
+        tpr_file = random_file(suffix=".tpr")
+        trr_file = random_file(suffix=".trr")
+        write_trr(trr_file, frames, box)
+
+        input_model = {
+            "proc_input": proc_input,
+            "mdp_file": inputs.mdp_file,
+            "gro_file": inputs.molecule,
+            "top_file": inputs.forcefield,
+            "tpr_file": tpr_file,
+        }
+        config = (self.extras or {}).get("config")
+        clean_files, cmd_input_grompp = self.build_input_grompp(
+            input_model, config=config
+        )
+        try:
+            rvalue = yield {**cmd_input_grompp, "timeout": remaining(deadline)}
+            self.cleanup(clean_files + [str(rvalue["scratch_directory"])])
+
+            input_model = {
+                "proc_input": proc_input,
+                "tpr_file": tpr_file,
+                "rerun_file": trr_file,
+            }
+            cmd_input_mdrun = self.build_input_mdrun(input_model, config=config)
+            rvalue = yield {**cmd_input_mdrun, "timeout": remaining(deadline)}
+        finally:
+            self.cleanup(
+                [*clean_files, tpr_file, trr_file, inputs.molecule]
+                + ([inputs.scratch_dir] if inputs.scratch_dir else [])
+            )
+
+        outfiles = {
+            Path(fname).suffix: fpath for fname, fpath in rvalue["outfiles"].items()
+        }
+        if ".edr" not in outfiles:
+            self.cleanup([str(rvalue["scratch_directory"])])
+            raise RuntimeError(f"mdrun -rerun failed:\n{rvalue['stderr']}")
+        energies = read_edr(outfiles[".edr"])
+        self.cleanup([str(rvalue["scratch_directory"])])
+        return energies
+
+    def tpr_cache(self) -> Optional[FileCache]:
+        """
+        Returns the grompp .tpr cache if enabled with ``extras["tpr_cache"]``,
+        which is either a directory or True for the default location. The
+        cache size in bytes is set with ``extras["tpr_cache_size"]``.
+        """
+        extras = self.extras or {}
+        path = extras.get("tpr_cache")
+        if not path:
+            return None
+        if path is True:
+            path = default_cache_dir("tpr")
+        return FileCache(
+            path, max_size=extras.get("tpr_cache_size", 2 ** 30), suffix=".tpr"
+        )
+
+    def allocate_cores(
+        self, config: Dict[str, Any], proc_input: "OptimInput"
+    ) -> ContextManager[Dict[str, Any]]:
+        """
+        Reserves ``config["ncores"]`` cores disjoint from other concurrent
+        runs if enabled with ``extras["pinning"]``, which is either True or
+        the lock directory shared by the runs. The context yields the
+        mdrun pinning options and releases the cores on exit. Explicit
+        pinning in the config or keywords is left untouched.
+        """
+        path = (self.extras or {}).get("pinning")
+        keywords = proc_input.keywords or {}
+        if (
+            not path
+            or not config.get("ncores")
+            or "pinoffset" in config
+            or "-pinoffset" in keywords
+        ):
+            return nullcontext({})
+        allocator = CoreAllocator(path if isinstance(path, str) else None)
+        return allocator.allocate(config["ncores"])
 
     @staticmethod
     def cleanup(remove: List[str]):
@@ -88,12 +413,13 @@ class ComputeGmxComponent(GenericComponent):
         assert inputs["proc_input"].engine == "gmx", "Engine must be gmx (Gromacs)!"
 
         env = os.environ.copy()
+        config = task_config(config)
 
-        if config:
-            env["MKL_NUM_THREADS"] = str(config.ncores)
-            env["OMP_NUM_THREADS"] = str(config.ncores)
+        if config.get("ncores"):
+            env["MKL_NUM_THREADS"] = str(config["ncores"])
+            env["OMP_NUM_THREADS"] = str(config["ncores"])
 
-        scratch_directory = config.scratch_directory if config else None
+        scratch_directory = config.get("scratch_directory")
 
         tpr_file = inputs["tpr_file"]
 
@@ -138,36 +464,74 @@ class ComputeGmxComponent(GenericComponent):
     ) -> Dict[str, Any]:
 
         env = os.environ.copy()
+        config = task_config(config)
+        if not config.get("ncores"):
+            # mdrun would start a thread per host core, ignoring cgroup quotas
+            config = {**config, "ncores": available_cores()}
 
-        if config:
-            env["MKL_NUM_THREADS"] = str(config.ncores)
-            env["OMP_NUM_THREADS"] = str(config.ncores)
+        if config.get("ncores"):
+            env["MKL_NUM_THREADS"] = str(config["ncores"])
+            env["OMP_NUM_THREADS"] = str(config["ncores"])
 
-        scratch_directory = config.scratch_directory if config else None
+        scratch_directory = config.get("scratch_directory")
 
-        log_fname = Path(tempfile.NamedTemporaryFile(suffix=".log")).name
-        trr_fname = Path(tempfile.NamedTemporaryFile(suffix=".trr")).name
-        edr_fname = Path(tempfile.NamedTemporaryFile(suffix=".edr")).name
-        gro_fname = Path(tempfile.NamedTemporaryFile(suffix=".gro")).name
+        log_fname = Path(random_file(suffix=".log")).name
+        trr_fname = Path(random_file(suffix=".trr")).name
+        edr_fname = Path(random_file(suffix=".edr")).name
+        gro_fname = Path(random_file(suffix=".gro")).name
 
         tpr_file = inputs["tpr_file"]
 
-        cmd = [
-            inputs["proc_input"].engine,  # Should here be gmx_mpi?
-            "mdrun",
-            "-s",
-            tpr_file,
-            "-o",
-            trr_fname,
-            "-c",
-            gro_fname,
-            "-e",
-            edr_fname,
-            "-g",
-            log_fname,
-        ]
-
-        outfiles = [trr_fname, gro_fname, edr_fname, log_fname]
+        infiles = [tpr_file]
+        if inputs.get("rerun_file"):
+            # Single points of the frames, only the energies are read
+            cmd = [
+                inputs["proc_input"].engine,
+                "mdrun",
+                "-s",
+                tpr_file,
+                "-rerun",
+                inputs["rerun_file"],
+                "-e",
+                edr_fname,
+                "-g",
+                log_fname,
+            ]
+            outfiles = [edr_fname, log_fname]
+            infiles.append(inputs["rerun_file"])
+        else:
+            cmd = [
+                inputs["proc_input"].engine,  # Should here be gmx_mpi?
+                "mdrun",
+                "-s",
+                tpr_file,
+                "-c",
+                gro_fname,
+                "-e",
+                edr_fname,
+                "-g",
+                log_fname,
+                "-v",  # per-step Epot and Fmax on stderr
+            ]
+            outfiles = [gro_fname, edr_fname, log_fname]
+
+            # The trajectory is only tracked if it is going to be read, one
+            # given as "trr_file" is left where mdrun writes it
+            if inputs.get("trr_file"):
+                cmd.extend(["-o", inputs["trr_file"]])
+            elif (self.extras or {}).get("trajectory") != "none":
+                cmd.extend(["-o", trr_fname])
+                outfiles.insert(0, trr_fname)
+
+        # Thread and pinning flags, unless given as keywords
+        keywords = inputs["proc_input"].keywords or {}
+        threads = mdrun_threads(config)
+        for flag, val in zip(threads[::2], threads[1::2]):
+            if flag not in keywords:
+                cmd.extend([flag, val])
+        if "-ntomp" in cmd or "-ntomp" in keywords:
+            # mdrun refuses OMP_NUM_THREADS differing from -ntomp
+            env.pop("OMP_NUM_THREADS", None)
 
         # For extra args
         if inputs["proc_input"].keywords:
@@ -179,8 +543,8 @@ class ComputeGmxComponent(GenericComponent):
 
         return {
             "command": cmd,
-            "as_binary": [Path(tpr_file).name],
-            "infiles": [tpr_file],
+            "as_binary": [Path(fname).name for fname in infiles],
+            "infiles": infiles,
             "outfiles": outfiles,
             "outfiles_track": outfiles,
             "scratch_directory": scratch_directory,
@@ -188,6 +552,65 @@ class ComputeGmxComponent(GenericComponent):
             "scratch_messy": True,
         }
 
+    def build_input_multidir(
+        self,
+        inputs: Dict[str, Any],
+        config: Optional["TaskConfig"] = None,
+        template: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Build the input for an MPI mdrun -multidir over ``inputs["dirs"]``,
+        each holding a topol.tpr
+        """
+        env = os.environ.copy()
+        config = task_config(config)
+        dirs = inputs["dirs"]
+
+        ntomp = max(1, (config.get("ncores") or available_cores()) // len(dirs))
+        env["OMP_NUM_THREADS"] = str(ntomp)
+        launcher = (config.get("mpiexec_command") or _mpiexec).format(
+            nnodes=config.get("nnodes", 1),
+            ranks_per_node=len(dirs),
+            total_ranks=len(dirs),
+            cores_per_rank=ntomp,
+        )
+
+        cmd = [
+            *shlex.split(launcher),
+            (self.extras or {}).get("mpi_engine", "gmx_mpi"),
+            "mdrun",
+            "-multidir",
+            *dirs,
+            "-s",
+            "topol.tpr",
+            "-c",
+            "confout.gro",
+            "-e",
+            "ener.edr",
+            "-g",
+            "md.log",
+            "-ntomp",
+            str(ntomp),
+        ]
+        if (self.extras or {}).get("trajectory") != "none":
+            cmd.extend(["-o", "traj.trr"])
+
+        keywords = inputs["proc_input"].keywords or {}
+        for key, val in keywords.items():
+            if val:
+                cmd.extend([key, val])
+            else:
+                cmd.extend([key])
+
+        return {
+            "command": cmd,
+            "infiles": [],
+            "outfiles": [],
+            "scratch_directory": config.get("scratch_directory"),
+            "environment": env,
+            "scratch_messy": True,
+        }
+
     def parse_output(
         self, output: Dict[str, str], inputs: Dict[str, Any]
     ) -> ComputeGmxInput:
@@ -196,13 +619,27 @@ class ComputeGmxComponent(GenericComponent):
         outfiles = output["outfiles"]
         scratch_dir = str(output["scratch_directory"])
 
-        traj, conf, energy, log = outfiles.values()
+        outfiles = {Path(fname).suffix: fpath for fname, fpath in outfiles.items()}
+        if ".gro" not in outfiles:
+            raise RuntimeError(
+                "mdrun did not write the final structure:\n"
+                f"{tail(output.get('stderr') or '')}"
+            )
+        traj = outfiles.get(".trr")
+        energy = outfiles.get(".edr")
+        log = outfiles.get(".log")
+        log_text = Path(log).read_text() if log is not None else ""
+        summary = parse_em_log(log_text)
+        stderr = output.get("stderr") or ""
 
         return self.output()(
             proc_input=inputs,
-            molecule=str(conf),
-            trajectory=str(traj),
+            molecule=str(outfiles[".gro"]),
+            trajectory=str(traj) if traj is not None else None,
             scratch_dir=scratch_dir,
+            energies=read_edr(str(energy)) if energy is not None else None,
+            progress=parse_em_steps(stderr),
+            **summary,
             # stdout=stdout,
             # stderr=stderr,
         )
@@ -6,10 +6,73 @@ from .gmx_prep_component import PrepGmxComponent
 from .gmx_compute_component import ComputeGmxComponent
 from .gmx_post_component import PostGmxComponent
 
+from ..util import (
+    random_file,
+    pack_molecules,
+    moleculetype_keys,
+    unit_scale,
+    box_vectors,
+    TrrFile,
+    gmx_version,
+    default_cache_dir,
+    get_result_cache,
+    ResultCache,
+    task_config,
+    available_cores,
+    available_workers,
+    threads_per_run,
+    run_scheduled,
+    drive,
+    drive_async,
+    remaining,
+    Steps,
+)
+
 from mmic.components.blueprints import TacticComponent
-from typing import Optional, Tuple, List, Any
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import numpy
+from functools import partial
+from typing import Optional, Tuple, List, Dict, Any, Union, Callable
+import os
+import shutil
+import tempfile
+import time
+import warnings
 
 __all__ = ["OptimGmxComponent"]
+# Component extras that change the returned output, part of the cache key
+_output_extras = ("trajectory", "trajectory_stride", "trajectory_last")
+# OptimInput fields packed inputs must share, and the nm between them,
+# twice the 1 nm gmx cutoffs
+_packed_fields = ("engine", "method", "tol", "step_size", "max_steps", "short_forces")
+_packed_gap = 2.0
+# Memory reserved per batch worker: a Python process with mmelemental,
+# parmed and pint imported takes about 60 MiB, the rest is a provisional
+# allowance for a small mdrun, not measured
+_worker_memory = 2 ** 28
+# OptimInput fields the conformers of an ensemble must share besides the
+# topology, so that they can use one mdp and top file
+_ensemble_fields = (*_packed_fields, "long_forces", "boundary", "keywords", "extras")
+_default_tol = 1000  # gmx emtol used by prep when tol is None
+
+
+def _compute_isolated(
+    comp: "OptimGmxComponent", inputs: OptimInput, **kwargs
+) -> OptimOutput:
+    """
+    Runs a single optimization inside its own scratch directory so that
+    concurrent jobs never share the CWD or the temp files gmx writes.
+    """
+    cwd, tempdir = os.getcwd(), tempfile.tempdir
+    with tempfile.TemporaryDirectory(prefix="mmic_optim_gmx_") as scratch:
+        os.chdir(scratch)
+        tempfile.tempdir = scratch
+        try:
+            return comp.compute(inputs, **kwargs)
+        finally:
+            tempfile.tempdir = tempdir
+            os.chdir(cwd)
 
 
 class OptimGmxComponent(TacticComponent):
@@ -23,6 +86,36 @@ class OptimGmxComponent(TacticComponent):
     def output(cls):
         return OptimOutput
 
+    @classmethod
+    def compute(
+        cls,
+        input_data: Union[OptimInput, Dict[str, Any]],
+        config: Optional["TaskConfig"] = None,
+        timeout: Optional[float] = None,
+        progress: Optional[Callable[[Dict[str, Any]], Any]] = None,
+        **kwargs,
+    ) -> OptimOutput:
+        """
+        Runs the minimization. The TaskConfig-like ``config`` (a TaskConfig,
+        a dict or any object with the same attributes) is stored in the
+        component extras as ``extras["config"]`` and limits the threads,
+        ranks and core pinning of mdrun; see :func:`mdrun_threads`. The
+        wall-clock ``timeout`` in seconds is stored as ``extras["timeout"]``,
+        see :meth:`steps`. The ``progress`` callback is stored as
+        ``extras["progress"]`` and called with the step, Epot and Fmax of
+        every step while mdrun runs, see :meth:`ComputeGmxComponent.steps`.
+        """
+        extras = dict(kwargs.get("extras") or {})
+        if config is not None:
+            extras["config"] = task_config(config)
+        if timeout is not None:
+            extras["timeout"] = timeout
+        if progress is not None:
+            extras["progress"] = progress
+        if extras:
+            kwargs["extras"] = extras
+        return super().compute(input_data, **kwargs)
+
     def execute(
         self,
         inputs: OptimInput,
@@ -32,10 +125,593 @@ class OptimGmxComponent(TacticComponent):
         timeout: Optional[int] = None,
     ) -> Tuple[bool, OptimOutput]:
 
-        computeInput = PrepGmxComponent.compute(inputs)
-        computeOutput = ComputeGmxComponent.compute(computeInput)
-        optimOutput = PostGmxComponent.compute(computeOutput)
-        return True, optimOutput
+        return True, drive(self.steps(inputs, timeout))
+
+    def steps(self, inputs: OptimInput, timeout: Optional[float] = None) -> Steps:
+        """
+        Yields the gmx commands of the prep and compute stages, see
+        :func:`drive`, then returns the OptimOutput. The ``timeout`` in
+        seconds, by default ``extras["timeout"]``, bounds the wall-clock
+        time of all stages: mdrun is killed and the output has the last
+        structure it wrote, with ``extras["timed_out"]`` set, while running
+        out of time before mdrun starts raises TimeoutError.
+
+        With ``inputs.extras["stages"]`` (see :meth:`PrepGmxComponent.stages`)
+        the stages run one after another and ``extras["stages"]`` of the
+        output holds the log summary of each. A stage that times out ends
+        the cascade.
+        """
+        timeout = timeout or (self.extras or {}).get("timeout")
+        deadline = time.monotonic() + timeout if timeout else None
+        if isinstance(inputs, dict):
+            inputs = self.input()(**inputs)
+
+        result_cache = self.result_cache()
+        if result_cache:
+            extras = self.extras or {}
+            result_key = result_cache.key(
+                inputs,
+                gmx_version(inputs.engine),
+                *(f"{key}={extras.get(key)}" for key in _output_extras),
+            )
+            optimOutput = result_cache.get(result_key)
+            if optimOutput is not None:
+                return optimOutput
+
+        computeOutput, summaries = yield from self.run_stages(inputs, deadline)
+        optimOutput = PostGmxComponent.compute(computeOutput, extras=self.extras)
+        if summaries:
+            optimOutput.extras["stages"] = [*summaries, optimOutput.extras["log"]]
+
+        # Lazy trajectories point at files the caller may remove
+        lazy = (self.extras or {}).get("trajectory") == "lazy"
+        # Stopped early by the timeout, a longer run would differ
+        timed_out = optimOutput.extras and optimOutput.extras.get("timed_out")
+        if result_cache and optimOutput.success and not lazy and not timed_out:
+            result_cache.put(result_key, optimOutput)
+
+        return optimOutput
+
+    def run_stages(
+        self,
+        inputs: OptimInput,
+        deadline: Optional[float] = None,
+        extras: Optional[Dict[str, Any]] = None,
+    ) -> Steps:
+        """
+        Yields the commands of prep and of every stage, see :meth:`steps`,
+        with the component ``extras`` (default: those of this component).
+        Returns the ComputeGmxOutput of the last stage run and the log
+        summaries of the stages before it.
+        """
+        extras = self.extras if extras is None else extras
+        prep = PrepGmxComponent(name=PrepGmxComponent.__name__, extras=extras)
+        computeInput = yield from prep.steps(inputs, remaining(deadline))
+        compute = ComputeGmxComponent(name=ComputeGmxComponent.__name__, extras=extras)
+
+        # Cascade of stages sharing the topology and box, each starting
+        # from the final coordinates of the previous one
+        nstages, summaries, top_file = len(prep.stages(inputs)), [], None
+        try:
+            for index in range(nstages):
+                if index:
+                    computeInput = prep.next_stage(
+                        inputs, computeOutput, top_file, index
+                    )
+                    top_file = None  # Owned by the stage input from here on
+                if index < nstages - 1:
+                    top_file = random_file(suffix=".top")  # grompp removes its input
+                    shutil.copyfile(computeInput.forcefield, top_file)
+                computeOutput = yield from compute.steps(
+                    computeInput, remaining(deadline)
+                )
+                if index < nstages - 1:
+                    if computeOutput.timed_out:
+                        break
+                    summaries.append(PostGmxComponent.log_summary(computeOutput))
+        finally:
+            # The copy for the next stage when the cascade ends early
+            if top_file is not None and os.path.isfile(top_file):
+                os.remove(top_file)
+        return computeOutput, summaries
+
+    @classmethod
+    def compute_packed(
+        cls,
+        inputs: List[OptimInput],
+        pack_size: Optional[int] = None,
+        extras: Optional[Dict[str, Any]] = None,
+        config: Optional["TaskConfig"] = None,
+        timeout: Optional[float] = None,
+    ) -> List[OptimOutput]:
+        """
+        Minimizes many small independent inputs, e.g. ligands of a virtual
+        screen, ``pack_size`` (default: all) at a time in a single
+        grompp/mdrun, see :meth:`packed_steps`. This saves the per-run
+        overhead of Python, subprocesses and scratch directories that
+        dominates for molecules of a few dozen atoms.
+
+        Returns
+        -------
+        List[OptimOutput]
+            Results in the order of ``inputs``.
+        """
+        inputs = [
+            cls.input()(**inp) if isinstance(inp, dict) else inp for inp in inputs
+        ]
+        if config is not None:
+            extras = {**(extras or {}), "config": task_config(config)}
+        program = cls(name=cls.__name__, extras=extras)
+
+        pack_size = pack_size or len(inputs)
+        outputs = []
+        for start in range(0, len(inputs), pack_size):
+            pack = inputs[start : start + pack_size]
+            outputs.extend(drive(program.packed_steps(pack, timeout)))
+        return outputs
+
+    def packed_steps(
+        self, inputs: List[OptimInput], timeout: Optional[float] = None
+    ) -> Steps:
+        """
+        Yields the gmx commands minimizing all ``inputs`` as one system and
+        returns their OptimOutputs. The molecules of each input are placed
+        in their own cell of a periodic grid, more than the cutoff away from
+        every other input, and electrostatics use a plain cutoff instead of
+        PME, so inputs do not interact. Inputs asking for other long-range
+        methods get a warning and ``extras["long_forces"]`` of the outputs
+        records the method used. The inputs must share the engine,
+        method, tolerance, step size, max steps and short-range forces.
+
+        The run stops once the largest force of all atoms is below ``tol``,
+        so every input gets its own Fmax, Fnorm and convergence from the
+        final forces in ``extras["log"]``, while the number of steps, the
+        timings and ``extras["timed_out"]`` are those of the pack. Epot is
+        not split per input and left out.
+        """
+        timeout = timeout or (self.extras or {}).get("timeout")
+        deadline = time.monotonic() + timeout if timeout else None
+        first = inputs[0]
+        for field in _packed_fields:
+            if any(getattr(inp, field) != getattr(first, field) for inp in inputs):
+                raise ValueError(f"Packed inputs must share {field}.")
+
+        replaced = {
+            inp.long_forces.method
+            for inp in inputs
+            if inp.long_forces.method.lower().replace("-", "") != "cutoff"
+        }
+        if replaced:
+            warnings.warn(
+                "Packed runs use cutoff electrostatics instead of "
+                f"{', '.join(sorted(replaced))}."
+            )
+
+        groups, box = pack_molecules(
+            [list(inp.molecule.values()) for inp in inputs], _packed_gap
+        )
+        molecule, forcefield = {}, {}
+        for i, (inp, group) in enumerate(zip(inputs, groups)):
+            ffs = PrepGmxComponent.system(inp)[2]
+            for key, mol, ff in zip(inp.molecule, group, ffs):
+                molecule[f"{i}.{key}"], forcefield[f"{i}.{key}"] = mol, ff
+
+        units = getattr(first, "cell_units", None) or "angstrom"
+        packed = first.copy(
+            update={
+                "molecule": molecule,
+                "forcefield": forcefield,
+                "boundary": ("periodic",) * 6,
+                "cell": (0.0, 0.0, 0.0, *(box * unit_scale("nm", units))),
+                "long_forces": first.long_forces.copy(update={"method": "Cut-off"}),
+            }
+        )
+
+        extras = {**(self.extras or {}), "packed": True, "trajectory": "native"}
+        computeOutput, _ = yield from self.run_stages(packed, deadline, extras)
+        outputs = self.split_packed(inputs, packed, computeOutput)
+        PostGmxComponent.cleanup([computeOutput.scratch_dir])
+        return outputs
+
+    @classmethod
+    def compute_ensemble(
+        cls,
+        inputs: List[OptimInput],
+        extras: Optional[Dict[str, Any]] = None,
+        config: Optional["TaskConfig"] = None,
+        timeout: Optional[float] = None,
+    ) -> List[OptimOutput]:
+        """
+        Minimizes conformers of the same system, e.g. hundreds of
+        conformers of one molecule, writing the topology once and running
+        them all in one ``mdrun -multidir``, see :meth:`ensemble_steps`.
+
+        Returns
+        -------
+        List[OptimOutput]
+            Results in the order of ``inputs``.
+        """
+        inputs = [
+            cls.input()(**inp) if isinstance(inp, dict) else inp for inp in inputs
+        ]
+        if config is not None:
+            extras = {**(extras or {}), "config": task_config(config)}
+        program = cls(name=cls.__name__, extras=extras)
+        return drive(program.ensemble_steps(inputs, timeout))
+
+    def ensemble_steps(
+        self, inputs: List[OptimInput], timeout: Optional[float] = None
+    ) -> Steps:
+        """
+        Yields the gmx commands minimizing the conformers ``inputs`` and
+        returns their OptimOutputs. The inputs must only differ in their
+        geometries and cells: the topology and mdp file of the first are
+        written once and shared by the grompp of every conformer, which
+        run concurrently, and a single multi-simulation mdrun minimizes
+        all of them, see :meth:`ComputeGmxComponent.ensemble_steps`.
+        Cascades of stages are not supported.
+        """
+        timeout = timeout or (self.extras or {}).get("timeout")
+        deadline = time.monotonic() + timeout if timeout else None
+        first = inputs[0]
+        for field in _ensemble_fields:
+            if any(getattr(inp, field) != getattr(first, field) for inp in inputs):
+                raise ValueError(f"Ensemble inputs must share {field}.")
+
+        prep = PrepGmxComponent(name=PrepGmxComponent.__name__, extras=self.extras)
+        if len(prep.stages(first)) > 1:
+            raise ValueError("Ensembles do not support stages.")
+        systems = [prep.system(inp) for inp in inputs]
+        topology = moleculetype_keys(systems[0][2], systems[0][1])
+        for names, mols, ffs in systems:
+            if names != systems[0][0] or moleculetype_keys(ffs, mols) != topology:
+                raise ValueError("Ensemble inputs must share the topology.")
+
+        computeInputs = [(yield from prep.steps(first, remaining(deadline)))]
+        for inp, (_, mols, _) in zip(inputs[1:], systems[1:]):
+            gro_file, scratch_dir = yield from prep.write_structure(
+                inp, mols, remaining(deadline)
+            )
+            computeInputs.append(
+                computeInputs[0].copy(
+                    update={
+                        "proc_input": inp,
+                        "molecule": gro_file,
+                        "scratch_dir": scratch_dir,
+                    }
+                )
+            )
+
+        compute = ComputeGmxComponent(
+            name=ComputeGmxComponent.__name__, extras=self.extras
+        )
+        computeOutputs = yield from compute.ensemble_steps(
+            computeInputs, remaining(deadline)
+        )
+        return [
+            PostGmxComponent.compute(computeOutput, extras=self.extras)
+            for computeOutput in computeOutputs
+        ]
+
+    @classmethod
+    def compute_rerun(
+        cls,
+        inputs: OptimInput,
+        geometries: numpy.ndarray,
+        geometry_units: str = "angstrom",
+        extras: Optional[Dict[str, Any]] = None,
+        config: Optional["TaskConfig"] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, numpy.ndarray]:
+        """
+        Computes the energies of many structures of the system of
+        ``inputs`` without minimizing them, in a single ``mdrun -rerun``,
+        see :meth:`rerun_steps`.
+
+        Parameters
+        ----------
+        inputs : OptimInput
+            The system; only its topology, box and interactions are used.
+        geometries : numpy.ndarray
+            Coordinates (nframes, natoms, 3) of all atoms of the molecules
+            of ``inputs``, in their order.
+        geometry_units : str, optional
+            Units of ``geometries``.
+
+        Returns
+        -------
+        Dict[str, numpy.ndarray]
+            "Time" and "Step", the frame index, plus one array of nframes
+            values per energy term e.g. "Potential", in kJ/mol.
+        """
+        if isinstance(inputs, dict):
+            inputs = cls.input()(**inputs)
+        if config is not None:
+            extras = {**(extras or {}), "config": task_config(config)}
+        program = cls(name=cls.__name__, extras=extras)
+        return drive(program.rerun_steps(inputs, geometries, geometry_units, timeout))
+
+    def rerun_steps(
+        self,
+        inputs: OptimInput,
+        geometries: numpy.ndarray,
+        geometry_units: str = "angstrom",
+        timeout: Optional[float] = None,
+    ) -> Steps:
+        """
+        Yields the gmx commands computing the energies of every frame of
+        ``geometries`` and returns them, see :meth:`compute_rerun`. The
+        topology and mdp file are written once and the frames are shifted
+        into the box of the molecules of ``inputs``, see
+        :meth:`ComputeGmxComponent.rerun_steps`.
+        """
+        timeout = timeout or (self.extras or {}).get("timeout")
+        deadline = time.monotonic() + timeout if timeout else None
+        extras = {**(self.extras or {}), "rerun": True}
+        prep = PrepGmxComponent(name=PrepGmxComponent.__name__, extras=extras)
+
+        mols = prep.system(inputs)[1]
+        natoms = sum(len(mol.symbols) for mol in mols)
+        frames = numpy.reshape(geometries, (len(geometries), -1, 3))
+        if frames.shape[1] != natoms:
+            raise ValueError(
+                f"Geometries have {frames.shape[1]} atoms, the system {natoms}."
+            )
+        box, offset = prep.get_box(inputs, mols)
+        frames = frames * unit_scale(geometry_units, "nm") + offset
+
+        computeInput = yield from prep.steps(inputs, remaining(deadline))
+        compute = ComputeGmxComponent(name=ComputeGmxComponent.__name__, extras=extras)
+        return (
+            yield from compute.rerun_steps(
+                computeInput, frames, box_vectors(box), remaining(deadline)
+            )
+        )
+
+    @staticmethod
+    def split_packed(
+        inputs: List[OptimInput],
+        packed: OptimInput,
+        computeOutput: "ComputeGmxOutput",
+    ) -> List[OptimOutput]:
+        """
+        Slices the final coordinates and forces of a packed run back into
+        one OptimOutput per input, see :meth:`packed_steps`. The molecules
+        are moved from their grid cell to where a single run of their
+        input would return them, boxed as :meth:`PrepGmxComponent.get_box`
+        does.
+        """
+        mols = PostGmxComponent.split_molecules(computeOutput.molecule, packed.molecule)
+        prep = PrepGmxComponent(name=PrepGmxComponent.__name__)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # Already warned about by the runs
+            packed_offset = prep.get_box(packed, list(packed.molecule.values()))[1]
+            offsets = [
+                prep.get_box(inp, list(inp.molecule.values()))[1] for inp in inputs
+            ]
+        sizes = [
+            sum(len(mol.symbols) for mol in inp.molecule.values()) for inp in inputs
+        ]
+        bounds = numpy.cumsum([0, *sizes])
+
+        # Final forces in kJ/mol/nm, written as the last frame with nstfout
+        norms = None
+        if computeOutput.trajectory is not None:
+            trr = TrrFile(computeOutput.trajectory)
+            if len(trr) and trr.has_field(len(trr) - 1, "f"):
+                forces = trr.read_frame(len(trr) - 1, ("f",))["f"]
+                norms = numpy.linalg.norm(forces, axis=1)
+
+        log = PostGmxComponent.log_summary(computeOutput)
+        outputs = []
+        for i, inp in enumerate(inputs):
+            summary = {**log, "epot": None, "fmax": None, "fmax_atom": None}
+            summary.update(fnorm=None, converged=None)
+            if norms is not None and sizes[i]:
+                norm = norms[bounds[i] : bounds[i + 1]]
+                atom = int(norm.argmax())
+                summary.update(
+                    fmax=float(norm[atom]),
+                    fmax_atom=atom + 1,
+                    fnorm=float(numpy.sqrt((norm ** 2).mean())),
+                    converged=bool(norm[atom] < (inp.tol or float(_default_tol))),
+                )
+                if summary["converged"]:
+                    summary["convergence"] = "fmax"
+
+            # nm to move the minimized molecules by, the same for all of them
+            first = next(iter(inp.molecule))
+            moved = packed.molecule[f"{i}.{first}"]
+            shift = offsets[i] - packed_offset
+            shift -= (
+                numpy.reshape(moved.geometry, (-1, 3))[0]
+                - numpy.reshape(inp.molecule[first].geometry, (-1, 3))[0]
+            ) / unit_scale("nm", moved.geometry_units)
+            molecule = {}
+            for key, mol in inp.molecule.items():
+                geo = numpy.reshape(mols[f"{i}.{key}"].geometry, (-1, 3))
+                geo = geo + shift * unit_scale("nm", mol.geometry_units)
+                molecule[key] = mols[f"{i}.{key}"].copy(
+                    update={"geometry": geo.reshape(numpy.shape(mol.geometry))}
+                )
+
+            outputs.append(
+                OptimOutput(
+                    proc_input=inp,
+                    molecule=molecule,
+                    schema_name=inp.schema_name,
+                    schema_version=inp.schema_version,
+                    success=True,
+                    extras={
+                        "log": summary,
+                        "timed_out": computeOutput.timed_out,
+                        "packed": len(inputs),
+                        "long_forces": packed.long_forces.method,
+                    },
+                )
+            )
+        return outputs
+
+    @classmethod
+    async def compute_async(
+        cls,
+        input_data: Union[OptimInput, Dict[str, Any]],
+        config: Optional["TaskConfig"] = None,
+        extras: Optional[Dict[str, Any]] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        timeout: Optional[float] = None,
+        progress: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    ) -> OptimOutput:
+        """
+        Coroutine version of :meth:`compute`. editconf, grompp and mdrun run
+        with ``asyncio.create_subprocess_exec`` so the event loop stays free
+        while they work. If ``semaphore`` is given the gmx commands only run
+        while holding it. Cancelling the task kills the running command and
+        removes its scratch directory. The ``timeout`` (s) covers the run
+        itself, not the wait for ``semaphore``. ``progress`` is called from
+        the event loop, see :meth:`compute`.
+        """
+        if config is not None:
+            extras = {**(extras or {}), "config": task_config(config)}
+        if timeout is not None:
+            extras = {**(extras or {}), "timeout": timeout}
+        if progress is not None:
+            extras = {**(extras or {}), "progress": progress}
+        program = cls(name=cls.__name__, extras=extras)
+
+        if semaphore is None:
+            return await drive_async(program.steps(input_data))
+        async with semaphore:
+            return await drive_async(program.steps(input_data))
+
+    @classmethod
+    async def compute_batch_async(
+        cls,
+        inputs: List[OptimInput],
+        max_concurrency: Optional[int] = None,
+        extras: Optional[Dict[str, Any]] = None,
+        config: Optional["TaskConfig"] = None,
+    ) -> List[Union[OptimOutput, Exception]]:
+        """
+        Runs many minimizations from one event loop, at most
+        ``max_concurrency`` (default: as many as the available cores and
+        memory allow, see :func:`available_workers`) at a time, each
+        with an equal share of the cores unless ``config`` is given, pinned
+        to disjoint cores with ``extras["pinning"]``. Results and
+        exceptions are returned in the order of ``inputs``.
+        """
+        if not inputs:
+            return []
+
+        ncores = available_cores()
+        max_concurrency = max_concurrency or available_workers(_worker_memory)
+        max_concurrency = max(1, min(max_concurrency, len(inputs)))
+        if config is None:
+            config = {"ncores": max(1, ncores // max_concurrency)}
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(
+            *(
+                cls.compute_async(inp, config, extras, semaphore=semaphore)
+                for inp in inputs
+            ),
+            return_exceptions=True,
+        )
+
+    def result_cache(self) -> Optional[ResultCache]:
+        """
+        Returns the result cache if enabled with ``extras["result_cache"]``.
+        The value is a directory for the on-disk tier, True for the default
+        location, or "memory" to keep results in this process only. The
+        tier sizes are set with ``extras["result_cache_entries"]`` (number
+        of outputs in memory) and ``extras["result_cache_size"]`` (bytes).
+        """
+        extras = self.extras or {}
+        path = extras.get("result_cache")
+        if not path:
+            return None
+        if path is True:
+            path = default_cache_dir("results")
+        elif path == "memory":
+            path = None
+        return get_result_cache(
+            path,
+            max_entries=extras.get("result_cache_entries", 128),
+            max_size=extras.get("result_cache_size", 2 ** 30),
+        )
+
+    @classmethod
+    def compute_batch(
+        cls,
+        inputs: List[OptimInput],
+        max_workers: Optional[int] = None,
+        extras: Optional[Dict[str, Any]] = None,
+        config: Optional["TaskConfig"] = None,
+    ) -> List[Union[OptimOutput, Exception]]:
+        """
+        Runs independent energy minimizations in a pool of processes.
+        By default each job gets threads according to its size (see
+        :func:`threads_per_run`) and jobs run side by side as long as
+        their threads fit in the available cores, so small molecules run
+        many at a time and large systems get many threads each.
+
+        Parameters
+        ----------
+        inputs : List[OptimInput]
+            Input schemas to minimize.
+        max_workers : int, optional
+            Number of jobs to run at a time, each with an equal share of
+            the cores. Disables the size-aware split. By default as many
+            as the available cores and memory allow, see
+            :func:`available_workers`.
+        extras : Dict[str, Any], optional
+            Component extras passed to every job e.g. {"tpr_cache": True}.
+            Lazy trajectories are kept in ``extras["trajectory_dir"]``,
+            by default the temporary directory of the caller.
+        config : TaskConfig, optional
+            Resources of each job e.g. {"ncores": 2}, see :meth:`compute`.
+            Disables the size-aware split. Jobs are pinned to disjoint
+            cores with ``extras["pinning"]``, see
+            :meth:`ComputeGmxComponent.allocate_cores`.
+
+        Returns
+        -------
+        List[Union[OptimOutput, Exception]]
+            Results in the order of ``inputs``. A job that failed is
+            returned as the exception it raised, the others are unaffected.
+        """
+        if not inputs:
+            return []
+
+        inputs = [
+            cls.input()(**inp) if isinstance(inp, dict) else inp for inp in inputs
+        ]
+        ncores = available_cores()
+        if config is not None:
+            configs = [task_config(config)] * len(inputs)
+        elif max_workers is not None:
+            share = max(1, ncores // max(1, min(max_workers, len(inputs))))
+            configs = [{"ncores": share}] * len(inputs)
+        else:
+            configs = [{"ncores": threads_per_run(inp, ncores)} for inp in inputs]
+        extras = dict(extras or {})
+        if extras.get("trajectory") == "lazy" and not extras.get("trajectory_dir"):
+            # Jobs run in scratch directories that are removed when they return
+            extras["trajectory_dir"] = tempfile.gettempdir()
+
+        max_workers = max_workers or available_workers(_worker_memory)
+        max_workers = max(1, min(max_workers, len(inputs)))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = run_scheduled(
+                executor,
+                partial(_compute_isolated, cls),
+                inputs,
+                configs,
+                ncores=ncores,
+                extras=extras,
+            )
+
+        return [future.exception() or future.result() for future in futures]
 
     def get_version(cls) -> str:
         """Finds program, extracts version, returns normalized version string.
@@ -2,16 +2,37 @@
 from mmic_optim.models.output import OptimOutput
 from mmelemental.models import Molecule, Trajectory
 from ..models import ComputeGmxOutput
+from ..util import (
+    random_file,
+    read_trajectory,
+    select_frames,
+    TrrFile,
+    read_gro,
+    unit_scale,
+)
 
 # Import components
 from mmic.components.blueprints import GenericComponent
 
-from typing import List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
+import numpy
 import os
 import shutil
 
 
 __all__ = ["PostGmxComponent"]
+_log_fields = {
+    "convergence",
+    "converged",
+    "nsteps",
+    "epot",
+    "fmax",
+    "fmax_atom",
+    "fnorm",
+    "core_time",
+    "wall_time",
+    "timings",
+}
 
 
 class PostGmxComponent(GenericComponent):
@@ -34,31 +55,36 @@ class PostGmxComponent(GenericComponent):
 
         """
         This method translate the output of em
-        to mmic schema. But right now it can only
-        be applied to single molecule conditions
+        to mmic schema. The final coordinates are
+        split per key into copies of the input
+        molecules, however many there are.
         """
 
         traj_file = inputs.trajectory
-        if inputs.proc_input.trajectory is None:
-            traj_name = list(inputs.proc_input.molecule)[0]
-            traj = {traj_name: Trajectory.from_file(traj_file)}
+        if traj_file is None:
+            traj = None  # final structure only
         else:
-            traj_name = list(inputs.proc_input.trajectory)[0]
-            traj_files = {traj_name: traj_file}
-            traj = {
-                key: Trajectory.from_file(trajs_files[key])
-                for key in inputs.proc_input.trajectory
-            }
-
-        mol_file = inputs.molecule
-        mol_name = list(inputs.proc_input.molecule)[0]
-        mol_files = {mol_name: mol_file}
-        mol = {
-            key: Molecule.from_file(mol_files[key])
-            for key in inputs.proc_input.molecule
-        }
+            if inputs.proc_input.trajectory is None:
+                traj_name = list(inputs.proc_input.molecule)[0]
+            else:
+                traj_name = list(inputs.proc_input.trajectory)[0]
+            traj = {traj_name: self.read_trajectory(traj_file)}
+
+        mol = self.split_molecules(inputs.molecule, inputs.proc_input.molecule)
         self.cleanup([inputs.scratch_dir])
 
+        # Convergence series: Epot from the .edr file, Fmax from mdrun
+        extras = {}
+        if inputs.energies is not None:
+            extras["energies"] = inputs.energies
+            extras["epot"] = inputs.energies.get("Potential")
+        if inputs.progress is not None:
+            extras["fmax"] = inputs.progress["fmax"]
+
+        # Final state and timings from the log
+        extras["log"] = self.log_summary(inputs)
+        extras["timed_out"] = inputs.timed_out
+
         return (
             True,
             OptimOutput(
@@ -68,9 +94,94 @@ class PostGmxComponent(GenericComponent):
                 schema_name=inputs.proc_input.schema_name,
                 schema_version=inputs.proc_input.schema_version,
                 success=True,
+                extras=extras,
             ),
         )
 
+    @staticmethod
+    def split_molecules(
+        gro_file: str, mols: Dict[str, Molecule]
+    ) -> Dict[str, Molecule]:
+        """
+        Splits the final coordinates of a system written from ``mols`` (see
+        :meth:`PrepGmxComponent.system`) back into copies of each input
+        Molecule with the minimized geometry, in its original units.
+        """
+        geo, _ = read_gro(gro_file)
+        natoms = [len(mol.symbols) for mol in mols.values()]
+        if len(geo) != sum(natoms):
+            raise ValueError(
+                f"{gro_file} has {len(geo)} atoms, the molecules {sum(natoms)}."
+            )
+
+        split, start = {}, 0
+        for (key, mol), count in zip(mols.items(), natoms):
+            coords = geo[start : start + count] * unit_scale("nm", mol.geometry_units)
+            split[key] = mol.copy(
+                update={"geometry": coords.reshape(numpy.shape(mol.geometry))}
+            )
+            start += count
+        return split
+
+    @staticmethod
+    def log_summary(inputs: ComputeGmxOutput) -> Dict[str, Any]:
+        """Returns the final state and timings of a run, see :func:`parse_em_log`."""
+        return inputs.dict(include=_log_fields)
+
+    def read_trajectory(self, traj_file: str) -> Trajectory:
+        """
+        Reads the mdrun trajectory according to the component extras:
+
+        - ``trajectory``: "none" skips writing and reading the trajectory,
+          "native" (default) streams only the kept frames
+          from the .trr file, "lazy" keeps the .trr file and returns a
+          Trajectory without arrays whose ``extras["trr_file"]`` can be
+          opened with :class:`TrrFile` to read frames on demand, and any
+          other value is used as the translator for Trajectory.from_file.
+        - ``trajectory_stride``: keep every Nth frame.
+        - ``trajectory_last``: keep only the last K (kept) frames.
+        - ``trajectory_dir``: where lazy .trr files are moved, defaults
+          to the temporary directory.
+        """
+        extras = self.extras or {}
+        reader = extras.get("trajectory", "native")
+        stride = extras.get("trajectory_stride")
+        last = extras.get("trajectory_last")
+
+        if reader == "native":
+            return read_trajectory(traj_file, stride=stride, last=last)
+        elif reader == "lazy":
+            trr_file = random_file(suffix=".trr", dir=extras.get("trajectory_dir"))
+            shutil.move(traj_file, trr_file)
+            trr = TrrFile(trr_file)
+            nframes = len(trr)
+            return Trajectory(
+                natoms=trr.natoms,
+                nframes=nframes,
+                timestep=float(trr.times[1] - trr.times[0]) if nframes > 1 else 0.0,
+                timestep_units="ps",
+                extras={"trr_file": trr_file, "steps": trr.steps, "times": trr.times},
+            )
+
+        traj = Trajectory.from_file(traj_file, translator=reader)
+        if stride is None and last is None:
+            return traj
+        return self.select_frames(traj, stride, last)
+
+    @staticmethod
+    def select_frames(
+        traj: Trajectory, stride: Optional[int], last: Optional[int]
+    ) -> Trajectory:
+        """Returns a copy of ``traj`` with every Nth and/or the last K frames."""
+        frames = select_frames(traj.nframes, stride, last)
+        update: Dict[str, Any] = {"nframes": len(frames)}
+        for key in ("geometry", "velocities", "forces"):
+            values = getattr(traj, key)
+            if values is not None:
+                values = values.reshape(traj.nframes, -1)[frames]
+                update[key] = values.ravel()
+        return Trajectory(**{**traj.dict(), **update})
+
     @staticmethod
     def cleanup(remove: List[str]):
         for item in remove:
@@ -1,19 +1,43 @@
 # Import models
 from mmic_optim.models.input import OptimInput
 from mmic_optim_gmx.models import ComputeGmxInput
+from mmic_optim_gmx.util import (
+    random_file,
+    write_gro,
+    write_system_top,
+    bounding_box,
+    cell_box,
+    box_vectors,
+    em_integrator,
+    has_constraints,
+    select_integrator,
+    system_size,
+    task_config,
+    drive,
+    Steps,
+)
 
 
 # Import components
-from mmic_cmd.components import CmdComponent
 from mmic.components.blueprints import GenericComponent
 
 from typing import Any, Dict, List, Tuple, Optional
 from pathlib import Path
+import numpy
 import os
-import tempfile
+import re
+import shutil
+import warnings
 
 __all__ = ["PrepGmxComponent"]
 _supported_solvents = ("spc", "tip3p", "tip4p")
+_box_margin = 2.0  # default nm between the molecule and the box
+_cutoff = 1.0  # nm, gmx default for rlist, rvdw and rcoulomb
+# OptimInput fields and extras that may change between the stages of a cascade
+_stage_fields = ("method", "tol", "max_steps", "step_size")
+_stage_options = ("nbfgscorr",)
+# nstfout writing forces only at the first step and the final structure
+_final_frame = 2 ** 30
 
 
 class PrepGmxComponent(GenericComponent):
@@ -23,6 +47,10 @@ class PrepGmxComponent(GenericComponent):
     converted to a .pdb file here.
     .mdp and .top files will also be constructed
     according to the info in MMIC schema.
+
+    The box is taken from OptimInput.cell when given, otherwise the
+    molecule is centered in a box with a margin of extras["box_margin"]
+    nm (default 2) on every side.
     """
 
     @classmethod
@@ -42,26 +70,97 @@ class PrepGmxComponent(GenericComponent):
         timeout: Optional[int] = None,
     ) -> Tuple[bool, ComputeGmxInput]:
 
+        return True, drive(self.steps(inputs, timeout))
+
+    def steps(self, inputs: OptimInput, timeout: Optional[float] = None) -> Steps:
+        """
+        Writes the gmx input files, yielding the editconf command if the
+        molecule is boxed with gmx. editconf is killed after ``timeout``
+        seconds. Returns the ComputeGmxInput.
+        """
         if isinstance(inputs, dict):
             inputs = self.input()(**inputs)
 
+        names, mols, ffs = self.system(inputs)
+
+        top_file = random_file(suffix=".top")
+
+        self.write_top(ffs, top_file, mols, names)
+        stages = self.stages(inputs)
+        mdp_file = self.write_mdp(
+            self.mdp_options(inputs, stages[0], len(stages) == 1, top_file)
+        )
+        boxed_gro_file, scratch_dir = yield from self.write_structure(
+            inputs, mols, timeout
+        )
+
+        gmx_compute = ComputeGmxInput(
+            proc_input=inputs,
+            schema_name=inputs.schema_name,
+            schema_version=inputs.schema_version,
+            mdp_file=mdp_file,
+            forcefield=top_file,
+            molecule=boxed_gro_file,
+            scratch_dir=scratch_dir,
+        )
+
+        return gmx_compute
+
+    @staticmethod
+    def stages(inputs: OptimInput) -> List[Dict[str, Any]]:
+        """
+        Returns the minimization stages, each a dict of method, tol,
+        max_steps and step_size, plus nbfgscorr, the number of l-bfgs
+        correction steps, from ``inputs.extras``. ``inputs.extras["stages"]``
+        is a list of dicts overriding these per stage e.g.
+        [{"method": "steepest descent", "tol": 1000}, {"method": "cg"}].
+        Without it the inputs are a single stage.
+        """
+        extras = inputs.extras or {}
+        base = {field: getattr(inputs, field) for field in _stage_fields}
+        base.update({option: extras.get(option) for option in _stage_options})
+        stages = extras.get("stages") or [{}]
+        for stage in stages:
+            unknown = set(stage) - set(base)
+            if unknown:
+                raise ValueError(
+                    f"Unknown stage fields {sorted(unknown)}, "
+                    f"expected some of {sorted(base)}."
+                )
+        return [{**base, **stage} for stage in stages]
+
+    def mdp_options(
+        self,
+        inputs: OptimInput,
+        stage: Dict[str, Any],
+        last: bool = True,
+        top_file: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Translates the input schema and a stage from :meth:`stages` into
+        mdp options. Only the ``last`` stage writes trajectory frames. The
+        "auto" method is resolved with :func:`select_integrator` from the
+        system size and whether ``top_file`` has constraints.
+        """
         mdp_inputs = {
-            "integrator": inputs.method,
-            "emtol": inputs.tol,
-            "emstep": inputs.step_size,
-            "nsteps": inputs.max_steps,
+            "integrator": stage["method"],
+            "emtol": stage["tol"],
+            "emstep": stage["step_size"],
+            "nsteps": stage["max_steps"],
             "pbc": inputs.boundary,
             "vdwtype": inputs.short_forces.method,
             "coulombtype": inputs.long_forces.method,
         }
 
-        # The following part is ugly and may be
-        # improved in the future
-        # Translate the method
-        if "steep" in mdp_inputs["integrator"]:
-            mdp_inputs["integrator"] = "steep"
-        if "conjugate" in mdp_inputs["integrator"]:
-            mdp_inputs["integrator"] = "cg"
+        # Translate the method, "auto" picks one for the system
+        mdp_inputs["integrator"] = em_integrator(mdp_inputs["integrator"])
+        if mdp_inputs["integrator"] == "auto":
+            constrained = top_file is not None and has_constraints(top_file)
+            mdp_inputs["integrator"] = select_integrator(
+                system_size(inputs), constrained
+            )
+        if mdp_inputs["integrator"] == "l-bfgs" and stage.get("nbfgscorr"):
+            mdp_inputs["nbfgscorr"] = stage["nbfgscorr"]
 
         if mdp_inputs["integrator"] is None:
             mdp_inputs["integrator"] = "steep"
@@ -86,50 +185,223 @@ class PrepGmxComponent(GenericComponent):
                 pbc = pbc + dim  # pbc is a str, may need to be initiated elsewhere
         mdp_inputs["pbc"] = pbc
 
-        # Write .mdp file
-        mdp_file = tempfile.NamedTemporaryFile(suffix=".mdp")
+        # Only the final structure is needed, skip trajectory frames
+        if (self.extras or {}).get("trajectory") == "none" or not last:
+            mdp_inputs.update({"nstxout": 0, "nstvout": 0, "nstfout": 0})
+        # Packed runs only read the final forces, see OptimGmxComponent.packed_steps
+        if (self.extras or {}).get("packed") and last:
+            mdp_inputs.update({"nstxout": 0, "nstvout": 0, "nstfout": _final_frame})
+        # Reruns only compute the energies of given frames, see
+        # OptimGmxComponent.rerun_steps; mdrun -rerun needs a dynamical integrator
+        if (self.extras or {}).get("rerun"):
+            mdp_inputs.update(
+                {
+                    "integrator": "md",
+                    "nstcalcenergy": 1,
+                    "nstenergy": 1,
+                    "nstxout": 0,
+                    "nstvout": 0,
+                    "nstfout": 0,
+                }
+            )
+
+        return mdp_inputs
+
+    @staticmethod
+    def write_mdp(mdp_inputs: Dict[str, Any]) -> str:
+        """Writes the mdp options to a new file and returns its path."""
+        mdp_file = random_file(suffix=".mdp")
         with open(mdp_file, "w") as inp:
             for key, val in mdp_inputs.items():
                 inp.write(f"{key} = {val}\n")
+        return mdp_file
 
-        fs = inputs.forcefield
-        mols = inputs.molecule
+    def next_stage(
+        self,
+        inputs: OptimInput,
+        previous: "ComputeGmxOutput",
+        top_file: str,
+        index: int,
+    ) -> ComputeGmxInput:
+        """
+        Prepares stage ``index`` of a cascade from the output of the
+        previous stage: its final coordinates, which keep the box, and the
+        topology ``top_file`` are combined with the mdp of the new stage.
+        """
+        stages = self.stages(inputs)
+        gro_file = random_file(suffix=".gro")
+        shutil.copyfile(previous.molecule, gro_file)
+        self.cleanup([previous.scratch_dir])
+        mdp_file = self.write_mdp(
+            self.mdp_options(inputs, stages[index], index == len(stages) - 1, top_file)
+        )
 
-        ff_name, ff = list(
-            fs.items()
-        ).pop()  # Here ff_name gets actually the related mol name, but it will not be used
-        mol_name, mol = list(mols.items()).pop()
+        return ComputeGmxInput(
+            proc_input=inputs,
+            schema_name=inputs.schema_name,
+            schema_version=inputs.schema_version,
+            mdp_file=mdp_file,
+            forcefield=top_file,
+            molecule=gro_file,
+        )
 
-        gro_file = tempfile.NamedTemporaryFile(suffix=".gro")  # output gro
-        top_file = tempfile.NamedTemporaryFile(suffix=".top")
-        boxed_gro_file = tempfile.NamedTemporaryFile(suffix=".gro")
+    @staticmethod
+    def system(
+        inputs: OptimInput,
+    ) -> Tuple[List[str], List["Molecule"], List["ForceField"]]:
+        """
+        Returns the molecule type names, molecules and force fields of all
+        entries of ``inputs.molecule``, in order. Force fields are matched
+        by key, or by position if the keys differ. Names are the keys
+        made safe for gmx.
+        """
+        mols, fs = inputs.molecule, inputs.forcefield
+        if set(fs) >= set(mols):
+            ffs = [fs[key] for key in mols]
+        elif len(fs) == len(mols):
+            ffs = list(fs.values())
+        else:
+            raise ValueError(
+                f"No force field for molecules {sorted(set(mols) - set(fs))}."
+            )
+
+        names = []
+        for key in mols:
+            name = re.sub(r"[^\w.-]", "_", str(key)) or "MOL"
+            names.append(name if name not in names else f"{name}_{len(names)}")
+        return names, list(mols.values()), ffs
+
+    def write_gro(self, mols: List["Molecule"], gro_file: str):
+        """
+        Writes the coordinates with the native NumPy writer unless
+        ``extras["gro_writer"]`` names a translator e.g. "mmic_parmed".
+        Falls back to mmic_parmed for molecules the native writer
+        does not support i.e. that are not 3D. Translators only write
+        single molecules.
+        """
+        writer = (self.extras or {}).get("gro_writer", "native")
+        if writer == "native":
+            if self._native_gro(mols):
+                return write_gro(mols, gro_file)
+            writer = "mmic_parmed"
+        self._single(mols, writer).to_file(gro_file, translator=writer)
 
-        mol.to_file(gro_file, translator="mmic_parmed")
-        ff.to_file(top_file, translator="mmic_parmed")
+    @staticmethod
+    def _native_gro(mols: List["Molecule"]) -> bool:
+        """Returns True if the native GRO writer supports all ``mols``."""
+        return all(mol.ndim == 3 for mol in mols)
 
+    @staticmethod
+    def _single(items: List[Any], writer: str) -> Any:
+        if len(items) != 1:
+            raise ValueError(
+                f"Writer {writer} does not combine {len(items)} molecules, "
+                "use the native writers."
+            )
+        return items[0]
+
+    def write_structure(
+        self,
+        inputs: OptimInput,
+        mols: List["Molecule"],
+        timeout: Optional[float] = None,
+    ) -> Steps:
+        """
+        Writes the boxed coordinates of ``mols``, yielding the editconf
+        command if the molecules are boxed with gmx. Returns the gro file
+        and the editconf scratch directory, None if editconf did not run.
+        """
+        gro_file = random_file(suffix=".gro")
+        boxed_gro_file = random_file(suffix=".gro")
+
+        # Box the molecule in Python unless editconf is requested
+        box, offset = self.get_box(inputs, mols)
+        if self.write_boxed_gro(mols, boxed_gro_file, box, offset):
+            return boxed_gro_file, None
+
+        self.write_gro(mols, gro_file)
         input_model = {
             "gro_file": gro_file,
             "proc_input": inputs,
             "boxed_gro_file": boxed_gro_file,
+            "box": box if inputs.cell is not None else None,
         }
-        clean_files, cmd_input = self.build_input(input_model)
-        rvalue = CmdComponent.compute(cmd_input)
-
-        ###boxed_gro_file = str(rvalue.outfiles[boxed_gro_file])
-        scratch_dir = str(rvalue.scratch_directory)
-        self.cleanup(clean_files)  # Del the gro in the working dir
-
-        gmx_compute = ComputeGmxInput(
-            proc_input=inputs,
-            schema_name=inputs.schema_name,
-            schema_version=inputs.schema_version,
-            mdp_file=mdp_file,
-            forcefield=top_file,
-            molecule=boxed_gro_file,
-            scratch_dir=scratch_dir,
+        clean_files, cmd_input = self.build_input(
+            input_model, config=(self.extras or {}).get("config")
         )
+        rvalue = yield {**cmd_input, "timeout": timeout}
+        self.cleanup(clean_files)  # Del the gro in the working dir
 
-        return True, gmx_compute
+        return boxed_gro_file, str(rvalue["scratch_directory"])
+
+    def get_box(
+        self, inputs: OptimInput, mols: List["Molecule"]
+    ) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """
+        Returns the GRO box line and the coordinate offset in nm. The
+        requested cell is used unless it is too small for the nonbonded
+        cutoff, in which case the margin box is used with a warning.
+        """
+        if inputs.cell is not None:
+            units = getattr(inputs, "cell_units", None) or "angstrom"
+            box, offset = cell_box(inputs.cell, units)
+            if numpy.linalg.norm(box_vectors(box), axis=1).min() >= 2 * _cutoff:
+                return box, offset
+            warnings.warn(
+                f"Cell {inputs.cell} is smaller than twice the {_cutoff} nm cutoff, "
+                "boxing the molecule with a margin instead."
+            )
+
+        margin = (inputs.extras or {}).get("box_margin", _box_margin)
+        return bounding_box(mols, margin)
+
+    def write_boxed_gro(
+        self,
+        mols: List["Molecule"],
+        gro_file: str,
+        box: numpy.ndarray,
+        offset: numpy.ndarray,
+    ) -> bool:
+        """
+        Writes the coordinates shifted by ``offset`` with the ``box`` line.
+        Returns False without writing anything if ``extras["box"]`` is
+        "editconf" or the native GRO writer is not used or does not support
+        ``mols``, in which case the caller boxes them with gmx editconf.
+        """
+        extras = self.extras or {}
+        if extras.get("box", "python") == "editconf":
+            return False
+        if extras.get("gro_writer", "native") != "native":
+            return False
+        if not self._native_gro(mols):
+            return False
+
+        write_gro(mols, gro_file, box=box, offset=offset)
+        return True
+
+    def write_top(
+        self,
+        ffs: List["ForceField"],
+        top_file: str,
+        mols: List["Molecule"],
+        names: List[str],
+    ):
+        """
+        Writes the topology with the native writer unless
+        ``extras["top_writer"]`` names a translator e.g. "mmic_parmed".
+        Falls back to mmic_parmed for potentials the native writer
+        does not support. Translators only write single molecules, so
+        for several the error of the native writer is raised.
+        """
+        writer = (self.extras or {}).get("top_writer", "native")
+        if writer == "native":
+            try:
+                return write_system_top(ffs, top_file, mols=mols, names=names)
+            except NotImplementedError:
+                if len(ffs) != 1:
+                    raise
+                writer = "mmic_parmed"
+        self._single(ffs, writer).to_file(top_file, translator=writer)
 
     @staticmethod
     def cleanup(remove: List[str]):
@@ -153,23 +425,32 @@ class PrepGmxComponent(GenericComponent):
         clean_files.append(inputs["gro_file"])
 
         env = os.environ.copy()
+        config = task_config(config)
 
-        if config:
-            env["MKL_NUM_THREADS"] = str(config.ncores)
-            env["OMP_NUM_THREADS"] = str(config.ncores)
+        if config.get("ncores"):
+            env["MKL_NUM_THREADS"] = str(config["ncores"])
+            env["OMP_NUM_THREADS"] = str(config["ncores"])
 
-        scratch_directory = config.scratch_directory if config else None
+        scratch_directory = config.get("scratch_directory")
 
         cmd = [
             inputs["proc_input"].engine,
             "editconf",
             "-f",
             inputs["gro_file"],
-            "-d",
-            "2",
             "-o",
             boxed_gro_file,
         ]
+
+        if inputs.get("box") is not None:
+            vectors = box_vectors(inputs["box"])
+            lengths = numpy.linalg.norm(vectors, axis=1)
+            a, b, c = vectors / lengths[:, None]
+            angles = numpy.degrees(numpy.arccos([b @ c, a @ c, a @ b]))
+            cmd.extend(["-box", *map(str, lengths), "-angles", *map(str, angles)])
+        else:
+            margin = (inputs["proc_input"].extras or {}).get("box_margin", _box_margin)
+            cmd.extend(["-d", str(margin)])
         outfiles = [boxed_gro_file]
 
         return (
@@ -1,6 +1,7 @@
 from cmselemental.models.procedures import ProcInput
 from mmic_optim.models import OptimInput
 from pydantic import Field
+from typing import Optional
 
 
 __all__ = ["ComputeGmxInput"]
@@ -20,7 +21,7 @@ class ComputeGmxInput(ProcInput):
         description="The file of the coordinates of the atoms in the system. Should be a .gro file.",
     )
 
-    scratch_dir: str = Field(
-        ...,
+    scratch_dir: Optional[str] = Field(
+        None,
         description="The path to the directory where the temporary files are written. Generally it's a directory in /tmp",
     )
@@ -1,6 +1,8 @@
 from cmselemental.models.base import ProtoModel
+from cmselemental.types import Array
 from mmic_optim.models import OptimInput
 from pydantic import Field
+from typing import Dict, Optional
 
 
 __all__ = ["ComputeGmxOutput"]
@@ -9,7 +11,53 @@ __all__ = ["ComputeGmxOutput"]
 class ComputeGmxOutput(ProtoModel):
     proc_input: OptimInput = Field(..., description="Procedure input schema.")
     molecule: str = Field(..., description="Molecule file string object")
-    trajectory: str = Field(..., description="Trajectory file string object.")
+    trajectory: Optional[str] = Field(
+        None, description="Trajectory file string object, None if not written."
+    )
     scratch_dir: str = Field(
         ..., description="The dir containing the traj file and the mold file"
     )
+    energies: Optional[Dict[str, Array[float]]] = Field(
+        None,
+        description="Energy terms per frame read from the .edr file, keyed by "
+        "term name e.g. Potential, plus Time and Step. Units are kJ/mol.",
+    )
+    progress: Optional[Dict[str, Array[float]]] = Field(
+        None,
+        description="Per-step step, epot (kJ/mol) and fmax (kJ/mol/nm) "
+        "reported by mdrun.",
+    )
+    convergence: Optional[str] = Field(
+        None,
+        description="How the minimization stopped according to the log: fmax "
+        "(reached emtol), machine_precision or max_steps.",
+    )
+    converged: Optional[bool] = Field(
+        None, description="Whether the maximum force dropped below emtol."
+    )
+    nsteps: Optional[int] = Field(None, description="Number of steps taken.")
+    epot: Optional[float] = Field(None, description="Final potential energy in kJ/mol.")
+    fmax: Optional[float] = Field(None, description="Final maximum force in kJ/mol/nm.")
+    fmax_atom: Optional[int] = Field(
+        None, description="Atom (1-based) the maximum force acts on."
+    )
+    fnorm: Optional[float] = Field(
+        None, description="Final norm of the force in kJ/mol/nm."
+    )
+    core_time: Optional[float] = Field(
+        None, description="Core time of mdrun in seconds."
+    )
+    wall_time: Optional[float] = Field(
+        None, description="Wall time of mdrun in seconds."
+    )
+    timings: Optional[Dict[str, Dict[str, float]]] = Field(
+        None,
+        description="Cycle and time accounting table of the log keyed by row "
+        "e.g. Force, with ranks, threads, calls, wall_time, giga_cycles and "
+        "percent columns.",
+    )
+    timed_out: bool = Field(
+        False,
+        description="Whether mdrun was killed at the deadline, the "
+        "molecule being the last structure it wrote.",
+    )
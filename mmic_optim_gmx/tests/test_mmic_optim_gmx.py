@@ -10,11 +10,64 @@ from mmelemental.models import Molecule, Trajectory, ForceField
 import mmic_optim_gmx
 
 from mmic_optim_gmx.components import OptimGmxComponent
+from mmic_optim_gmx.components.gmx_prep_component import PrepGmxComponent
+from mmic_optim_gmx.components.gmx_compute_component import ComputeGmxComponent
+from mmic_optim_gmx.components.gmx_post_component import PostGmxComponent
+from mmic_optim_gmx.models import ComputeGmxOutput
+from mmic_optim_gmx.util import (
+    write_gro,
+    read_gro,
+    write_top,
+    TrrFile,
+    CoreAllocator,
+    available_cores,
+    threads_per_run,
+    run_scheduled,
+    drive,
+    drive_async,
+    run_command_async,
+    EmProgress,
+    has_constraints,
+    select_integrator,
+    write_system_top,
+    moleculetype_keys,
+    write_trr,
+    unit_scale,
+)
 
+import asyncio
+import json
 import mm_data
+import numpy
+import parmed
 import pytest
+import shutil
 import sys
 import os
+import tempfile
+
+
+def water_input(**kwargs):
+    mol = mmelemental.models.Molecule.from_file(mm_data.mols["water-mol.json"])
+    ff = mmelemental.models.ForceField.from_file(mm_data.ffs["water-ff.json"])
+
+    inputs = {
+        "engine": "gmx",
+        "schema_name": "test",
+        "schema_version": 1.0,
+        "molecule": {"mol": mol},
+        "forcefield": {"mol": ff},
+        "boundary": ("periodic",) * 6,
+        "cell": (0, 0, 0, 1, 1, 1),
+        "max_steps": 10,
+        "step_size": 0.01,
+        "tol": 1000,
+        "method": "steepest descent",
+        "long_forces": {"method": "PME"},
+        "short_forces": {"method": "cutoff"},
+    }
+    inputs.update(kwargs)
+    return OptimInput(**inputs)
 
 
 def test_mmic_optim_gmx_imported():
@@ -61,6 +114,766 @@ def test_preprocess_component():
     outputs = OptimGmxComponent.compute(inputs)
 
 
+def test_compute_batch():
+    """
+    Runs several minimizations in a process pool and checks
+    the results are returned in order, with failures isolated.
+    """
+    inputs = [water_input(max_steps=5), water_input(engine="not_gmx"), water_input()]
+    outputs = OptimGmxComponent.compute_batch(inputs, max_workers=2)
+
+    assert len(outputs) == len(inputs)
+    assert isinstance(outputs[0], OptimOutput)
+    assert isinstance(outputs[1], Exception)
+    assert isinstance(outputs[2], OptimOutput)
+    assert outputs[0].proc_input.max_steps == 5
+
+    # Lazy trajectories outlive the scratch directories of the jobs
+    outputs = OptimGmxComponent.compute_batch(
+        [water_input(), water_input()], extras={"trajectory": "lazy"}
+    )
+    for out in outputs:
+        trr_file = out.trajectory["mol"].extras["trr_file"]
+        assert len(TrrFile(trr_file)) > 0
+        os.remove(trr_file)
+
+
+def test_tpr_cache(tmp_path):
+    """
+    Runs the same minimization twice with the grompp cache
+    enabled and checks a single .tpr entry is stored.
+    """
+    extras = {"tpr_cache": str(tmp_path)}
+    for _ in range(2):
+        OptimGmxComponent.compute(water_input(), extras=extras)
+
+    assert len(list(tmp_path.glob("*.tpr"))) == 1
+
+
+def test_result_cache(tmp_path):
+    """
+    Checks a repeated request is served from the memory tier
+    and that the on-disk tier is populated.
+    """
+    extras = {"result_cache": str(tmp_path)}
+    first = OptimGmxComponent.compute(water_input(), extras=extras)
+    second = OptimGmxComponent.compute(water_input(), extras=extras)
+
+    assert second is first
+    assert len(list(tmp_path.glob("*.pkl"))) == 1
+
+
+data_dir = os.path.join(os.path.dirname(mmic_optim_gmx.__file__), "data")
+
+
+@pytest.mark.parametrize(
+    "mol_file",
+    [mm_data.mols["water-mol.json"], os.path.join(data_dir, "molecule.json")],
+)
+def test_gro_writer(mol_file, tmp_path):
+    """
+    Checks the native GRO writer matches the mmic_parmed output byte for byte.
+    """
+    mol = Molecule.from_file(mol_file)
+    native, parmed = tmp_path / "native.gro", tmp_path / "parmed.gro"
+
+    write_gro(mol, str(native))
+    mol.to_file(str(parmed), translator="mmic_parmed")
+
+    assert native.read_bytes() == parmed.read_bytes()
+
+
+def test_top_writer(tmp_path):
+    """
+    Loads the native and mmic_parmed topologies with ParmEd
+    and checks they define the same parameters.
+    """
+    mol = Molecule.from_file(mm_data.mols["water-mol.json"])
+    ff = ForceField.from_file(mm_data.ffs["water-ff.json"])
+    native, ref = tmp_path / "native.top", tmp_path / "parmed.top"
+
+    write_top(ff, str(native), mol=mol)
+    ff.to_file(str(ref), translator="mmic_parmed")
+    native, ref = parmed.load_file(str(native)), parmed.load_file(str(ref))
+
+    def atoms(top):
+        return [(a.charge, a.mass, a.sigma, a.epsilon) for a in top.atoms]
+
+    def bonds(top):
+        return [(b.atom1.idx, b.atom2.idx, b.type.req, b.type.k) for b in top.bonds]
+
+    def angles(top):
+        return [
+            (a.atom1.idx, a.atom2.idx, a.atom3.idx, a.type.theteq, a.type.k)
+            for a in top.angles
+        ]
+
+    for terms in (atoms, bonds, angles):
+        assert numpy.allclose(terms(native), terms(ref), rtol=1e-5)
+
+
+def test_top_writer_dihedrals(tmp_path):
+    """
+    Writes the bundled alanine dipeptide force field with Charmm proper
+    and improper dihedrals and checks ParmEd reads back the dihedrals,
+    the 1-4 pairs and the fudge factors.
+    """
+    with open(os.path.join(data_dir, "forcefield.json")) as fp:
+        data = json.load(fp)
+    # The bundled file predates connectivity and the per-model combination rule
+    for name in ("bonds", "angles"):
+        data[name]["connectivity"] = data[name].pop("indices")
+    data["nonbonded"]["combination_rule"] = data.pop("combination_rule")
+
+    neighbors = {}
+    for i, j, _ in data["bonds"]["connectivity"]:
+        neighbors.setdefault(i, set()).add(j)
+        neighbors.setdefault(j, set()).add(i)
+    propers = [
+        (i, j, k, l)
+        for j, k, _ in data["bonds"]["connectivity"]
+        for i in neighbors[j] - {k}
+        for l in neighbors[k] - {i, j}
+    ]
+    energy = numpy.linspace(0.5, 2.0, len(propers))
+    phase = numpy.where(numpy.arange(len(propers)) % 2, 180.0, 0.0)
+    periodicity = 1 + numpy.arange(len(propers)) % 3
+    data["dihedrals"] = {
+        "form": "Charmm",
+        "connectivity": propers,
+        "params": {
+            "energy": energy.tolist(),
+            "energy_units": "kJ/mol",
+            "phase": phase.tolist(),
+            "phase_units": "degrees",
+            "periodicity": periodicity.tolist(),
+        },
+    }
+    impropers = [(1, 6, 4, 5), (10, 16, 14, 15)]  # planar peptide carbonyls
+    data["dihedrals_improper"] = {
+        "form": "Charmm",
+        "connectivity": impropers,
+        "params": {
+            "energy": [4.6, 4.6],
+            "energy_units": "kJ/mol",
+            "phase": [180.0, 180.0],
+            "phase_units": "degrees",
+            "periodicity": [2, 2],
+        },
+    }
+    data["extras"] = {"fudgeLJ": 0.5, "fudgeQQ": 0.8333}
+
+    top_file = tmp_path / "dipeptide.top"
+    write_top(ForceField(**data), str(top_file))
+    top = parmed.load_file(str(top_file))
+
+    assert (top.defaults.fudgeLJ, top.defaults.fudgeQQ) == (0.5, 0.8333)
+
+    kcal = 4.184  # ParmEd reads kJ/mol as kcal/mol
+    read = [d for d in top.dihedrals if not d.improper]
+    assert [(d.atom1.idx, d.atom2.idx, d.atom3.idx, d.atom4.idx) for d in read] == [
+        tuple(idx) for idx in propers
+    ]
+    assert numpy.allclose([d.type[0].phi_k * kcal for d in read], energy, rtol=1e-5)
+    assert numpy.allclose([d.type[0].phase for d in read], phase)
+    assert [d.type[0].per for d in read] == periodicity.tolist()
+
+    read = [d for d in top.dihedrals if d.improper]
+    assert [(d.atom1.idx, d.atom2.idx, d.atom3.idx, d.atom4.idx) for d in read] == [
+        tuple(idx) for idx in impropers
+    ]
+    assert numpy.allclose([d.type.phi_k * kcal for d in read], 4.6, rtol=1e-5)
+    assert [(d.type.phase, d.type.per) for d in read] == [(180.0, 2)] * 2
+
+    # Every dihedral end pair is 1-4 since the dipeptide has no rings
+    pairs = {tuple(sorted((i, l))) for i, _, _, l in propers}
+    assert {tuple(sorted((p.atom1.idx, p.atom2.idx))) for p in top.adjusts} == pairs
+
+
+def test_python_box():
+    """
+    Checks the prep stage boxes the molecule without editconf,
+    with a 2 nm margin on every side.
+    """
+    inputs = water_input()
+    prep = PrepGmxComponent.compute(inputs)
+
+    with open(prep.molecule) as fp:
+        lines = fp.readlines()
+    PrepGmxComponent.cleanup([prep.molecule, prep.mdp_file, prep.forcefield])
+
+    mol = inputs.molecule["mol"]
+    geo = mol.geometry.reshape(-1, 3) / 10.0  # angstrom to nm
+    box = numpy.array(lines[-1].split(), dtype=float)
+    coords = numpy.array(
+        [[line[20:28], line[28:36], line[36:44]] for line in lines[2:-1]], dtype=float
+    )
+
+    assert prep.scratch_dir is None
+    assert numpy.allclose(box, geo.max(axis=0) - geo.min(axis=0) + 4.0, atol=1e-4)
+    assert numpy.allclose(coords.min(axis=0), 2.0, atol=1e-3)
+
+
+@pytest.mark.parametrize(
+    "cell, box",
+    [
+        ((-15, -15, -15, 15, 15, 15), [3.0, 3.0, 3.0]),
+        (
+            (30, 0, 0, 10, 30, 0, 5, 5, 30),
+            [3.0, 3.0, 3.0, 0.0, 0.0, 1.0, 0.0, 0.5, 0.5],
+        ),
+    ],
+)
+def test_cell_box(cell, box):
+    """Checks the prep stage writes the requested rectangular or triclinic cell."""
+    prep = PrepGmxComponent.compute(water_input(cell=cell))
+
+    with open(prep.molecule) as fp:
+        line = fp.readlines()[-1]
+    PrepGmxComponent.cleanup([prep.molecule, prep.mdp_file, prep.forcefield])
+
+    assert numpy.allclose(numpy.array(line.split(), dtype=float), box)
+
+
+def test_box_margin():
+    """Checks extras["box_margin"] sets the distance to the box edges."""
+    inputs = water_input(cell=None, extras={"box_margin": 1.2})
+    prep = PrepGmxComponent.compute(inputs)
+
+    with open(prep.molecule) as fp:
+        line = fp.readlines()[-1]
+    PrepGmxComponent.cleanup([prep.molecule, prep.mdp_file, prep.forcefield])
+
+    geo = inputs.molecule["mol"].geometry.reshape(-1, 3) / 10.0
+    box = numpy.array(line.split(), dtype=float)
+    assert numpy.allclose(box, geo.max(axis=0) - geo.min(axis=0) + 2.4, atol=1e-4)
+
+
+def test_trajectory_frames(tmp_path):
+    """
+    Checks the kept trajectory frames match the full trajectory and
+    that lazy mode reads the same frames on demand from the .trr file.
+    """
+    inputs = water_input(max_steps=20)
+    full = OptimGmxComponent.compute(inputs).trajectory["mol"]
+    last = OptimGmxComponent.compute(
+        inputs, extras={"trajectory_stride": 2, "trajectory_last": 3}
+    ).trajectory["mol"]
+    lazy = OptimGmxComponent.compute(
+        inputs, extras={"trajectory": "lazy", "trajectory_dir": str(tmp_path)}
+    ).trajectory["mol"]
+
+    frames = numpy.arange(full.nframes)[::2][-3:]
+    nfree = full.natoms * full.ndim
+    assert last.nframes == len(frames)
+    assert numpy.allclose(
+        last.geometry, full.geometry.reshape(-1, nfree)[frames].ravel()
+    )
+
+    trr = TrrFile(lazy.extras["trr_file"])
+    assert lazy.geometry is None
+    assert len(trr) == lazy.nframes == full.nframes
+    assert numpy.allclose(
+        trr[-1]["x"].ravel() * 10.0, full.get_geometry(full.nframes - 1)
+    )
+
+
+def test_final_structure_only():
+    """Checks no trajectory is written or returned in final-structure mode."""
+    inputs = water_input()
+    prep = PrepGmxComponent.compute(inputs, extras={"trajectory": "none"})
+    with open(prep.mdp_file) as fp:
+        mdp = fp.read()
+    assert "nstxout = 0" in mdp and "nstfout = 0" in mdp
+
+    compute = ComputeGmxComponent.compute(prep, extras={"trajectory": "none"})
+    assert compute.trajectory is None
+    PostGmxComponent.cleanup([compute.scratch_dir])
+
+    outputs = OptimGmxComponent.compute(inputs, extras={"trajectory": "none"})
+    assert outputs.trajectory is None
+    assert "mol" in outputs.molecule
+
+
+def test_energies():
+    """Checks the Epot and Fmax series are attached to the output."""
+    outputs = OptimGmxComponent.compute(water_input(max_steps=20))
+    energies = outputs.extras["energies"]
+
+    assert len(energies["Step"]) == len(outputs.extras["epot"]) > 0
+    assert numpy.array_equal(energies["Potential"], outputs.extras["epot"])
+    assert len(outputs.extras["fmax"]) > 0
+    assert (outputs.extras["fmax"] >= 0).all()
+
+
+@pytest.mark.parametrize("tol, converged", [(1e6, True), (1e-6, False)])
+def test_log_summary(tol, converged):
+    """Checks convergence, final state and timings are read from the log."""
+    outputs = OptimGmxComponent.compute(water_input(tol=tol, max_steps=5))
+    log = outputs.extras["log"]
+
+    assert log["converged"] is converged
+    assert log["convergence"] == ("fmax" if converged else "max_steps")
+    assert log["nsteps"] <= 5
+    assert log["fmax_atom"] >= 1
+    assert numpy.isclose(log["epot"], outputs.extras["epot"].min(), rtol=1e-5)
+    assert "Total" in log["timings"]
+
+
+def test_task_config():
+    """Checks a TaskConfig-like object limits the mdrun threads."""
+    config = {"ncores": 2, "pinoffset": 0}
+    cmd = ComputeGmxComponent(name="ComputeGmxComponent").build_input_mdrun(
+        {"proc_input": water_input(), "tpr_file": "topol.tpr"}, config=config
+    )["command"]
+    for flag, val in (("-nt", "2"), ("-ntmpi", "1"), ("-ntomp", "2"), ("-pin", "on")):
+        assert cmd[cmd.index(flag) + 1] == val
+
+    outputs = OptimGmxComponent.compute(water_input(), config={"ncores": 1})
+    assert outputs.success
+
+    # Without a config mdrun gets the available cores, not the host's
+    cmd = ComputeGmxComponent(name="ComputeGmxComponent").build_input_mdrun(
+        {"proc_input": water_input(), "tpr_file": "topol.tpr"}
+    )["command"]
+    assert cmd[cmd.index("-nt") + 1] == str(available_cores())
+
+
+def test_core_allocator(tmp_path):
+    """Checks concurrent allocations get disjoint cores within a NUMA node."""
+    cores = [[cpu] for cpu in range(8)]
+    allocator = CoreAllocator(
+        str(tmp_path), nodes=[[0, 1, 2, 3], [4, 5, 6, 7]], cores=cores
+    )
+    with allocator.allocate(2) as first, allocator.allocate(3) as second:
+        assert first == {"pin": True, "pinoffset": 0, "pinstride": 1}
+        assert second["pinoffset"] == 4
+        with allocator.allocate(3) as third:
+            assert third == {}
+
+    # Released cores are handed out again
+    with allocator.allocate(4) as first:
+        assert first["pinoffset"] == 0
+
+    # With 2 hardware threads per core (siblings 0 and 4, 1 and 5, ...)
+    # offsets are mdrun logical cores and runs never share a physical core
+    cores = [[0, 4], [1, 5], [2, 6], [3, 7]]
+    allocator = CoreAllocator(
+        str(tmp_path / "smt"), nodes=[list(range(8))], cores=cores
+    )
+    with allocator.allocate(1) as first, allocator.allocate(2) as second:
+        assert first["pinoffset"] == 0
+        assert second["pinoffset"] == 2
+        with allocator.allocate(3) as third:
+            assert third["pinoffset"] == 4
+            with allocator.allocate(1) as fourth:
+                assert fourth == {}
+
+
+def test_discover_hardware(tmp_path, monkeypatch):
+    """Checks cgroup v2 CPU and memory limits of parent groups are honored."""
+    from mmic_optim_gmx.util import hardware
+
+    (tmp_path / "job" / "step").mkdir(parents=True)
+    (tmp_path / "job" / "cpu.max").write_text("150000 100000\n")
+    (tmp_path / "job" / "step" / "cpu.max").write_text("max 100000\n")
+    (tmp_path / "job" / "step" / "memory.max").write_text(f"{2 ** 30}\n")
+    monkeypatch.setattr(hardware, "_cgroup_root", str(tmp_path))
+    monkeypatch.setattr(hardware, "_cgroups", lambda: [("", "/job/step")])
+    hardware.discover_hardware.cache_clear()
+
+    try:
+        info = hardware.discover_hardware()
+        assert info.cpu_quota == 1.5
+        assert info.memory <= 2 ** 30
+        assert info.ncores == 1  # 1.5 cores rounded down
+    finally:
+        hardware.discover_hardware.cache_clear()
+
+    info = hardware.Hardware(cpus=tuple(range(8)), cpu_quota=None, memory=2 ** 30)
+    monkeypatch.setattr(hardware, "discover_hardware", lambda: info)
+    assert hardware.available_workers(2 ** 28) == 4
+    assert hardware.available_workers(2 ** 27) == 8
+    assert hardware.available_workers(2 ** 32) == 1
+
+
+def test_scheduler():
+    """
+    Checks small systems get one thread each and that scheduled jobs
+    never use more than the available cores at a time.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Lock
+    import time
+
+    assert threads_per_run(water_input(), 64) == 1
+
+    lock, used, peak = Lock(), [0], [0]
+
+    def job(size, config):
+        with lock:
+            used[0] += config["ncores"]
+            peak[0] = max(peak[0], used[0])
+        time.sleep(0.01)
+        with lock:
+            used[0] -= config["ncores"]
+        return size
+
+    sizes = [4, 1, 1, 2, 1, 2, 1, 3]
+    with ThreadPoolExecutor(len(sizes)) as executor:
+        futures = run_scheduled(
+            executor, job, sizes, [{"ncores": size} for size in sizes], ncores=4
+        )
+
+    assert [future.result() for future in futures] == sizes
+    assert peak[0] <= 4
+
+
+def test_compute_async():
+    """Runs minimizations from an event loop with bounded concurrency."""
+    inputs = [water_input(max_steps=5), water_input(engine="not_gmx"), water_input()]
+    outputs = asyncio.run(
+        OptimGmxComponent.compute_batch_async(inputs, max_concurrency=2)
+    )
+
+    assert isinstance(outputs[0], OptimOutput)
+    assert isinstance(outputs[1], Exception)
+    assert isinstance(outputs[2], OptimOutput)
+
+
+def test_cancel_async(tmp_path):
+    """Checks cancelling a stage kills its command and runs its cleanup."""
+    closed = []
+
+    def stage():
+        try:
+            yield {"command": ["sleep", "60"], "scratch_directory": str(tmp_path)}
+        finally:
+            closed.append(True)
+
+    async def cancel():
+        task = asyncio.ensure_future(drive_async(stage()))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    assert closed == [True]
+    assert not os.listdir(tmp_path)  # scratch directory removed
+
+
+def test_command_failure():
+    """Checks failed commands raise with the end of their stderr."""
+    cmd_input = {"command": [sys.executable, "-c", "exit('Fatal error: bad input')"]}
+    with pytest.raises(RuntimeError, match="bad input"):
+        asyncio.run(run_command_async(cmd_input))
+
+    with pytest.raises(RuntimeError, match="grompp failed"):
+        OptimGmxComponent.compute(water_input(method="not_an_integrator"))
+
+
+def test_timeout(tmp_path):
+    """
+    Checks overdue commands are killed and a killed mdrun returns the last
+    frame it wrote, with the nstxout of a requested trajectory kept.
+    """
+    cmd_input = {"command": ["sleep", "60"], "scratch_directory": str(tmp_path)}
+    with pytest.raises(TimeoutError):
+        asyncio.run(run_command_async({**cmd_input, "timeout": 0.5}))
+    assert not os.listdir(tmp_path)
+
+    inputs = water_input()
+    natoms = len(inputs.molecule["mol"].symbols)
+    frames = numpy.random.rand(2, natoms, 3) + 1.0
+    mdps = []
+
+    def run(cmd_input):
+        """grompp writes an empty .tpr, mdrun two frames before it is killed"""
+        cmd = cmd_input["command"]
+        if "grompp" in cmd:
+            with open(cmd[cmd.index("-f") + 1]) as fp:
+                mdps.append(fp.read())
+            open(cmd[cmd.index("-o") + 1], "w").close()
+            scratch = tempfile.mkdtemp(dir=tmp_path)
+            return {"scratch_directory": scratch, "outfiles": {}, "stderr": ""}
+        write_trr(cmd[cmd.index("-o") + 1], frames, numpy.eye(3) * 2.0)
+        raise TimeoutError("killed")
+
+    async def run_async(cmd_input):
+        return run(cmd_input)
+
+    nm = unit_scale("nm", inputs.molecule["mol"].geometry_units)
+    for trajectory in ("none", "native"):
+        program = OptimGmxComponent(
+            name="OptimGmxComponent", extras={"trajectory": trajectory}
+        )
+        for outputs in (
+            drive(program.steps(inputs, timeout=600), run),
+            asyncio.run(drive_async(program.steps(inputs, timeout=600), run_async)),
+        ):
+            assert outputs.success and outputs.extras["timed_out"]
+            geo = numpy.reshape(outputs.molecule["mol"].geometry, (-1, 3)) / nm
+            assert numpy.allclose(geo, frames[-1], atol=1e-3)
+            assert (outputs.trajectory is None) == (trajectory == "none")
+    assert all("nstxout = 100" in mdp for mdp in mdps[:2])
+    assert not any("nstxout = 100" in mdp for mdp in mdps[2:])
+
+    outputs = OptimGmxComponent.compute(water_input(), timeout=600)
+    assert outputs.success and not outputs.extras["timed_out"]
+
+
+def test_progress():
+    """Checks the per-step progress is reported while mdrun runs."""
+    steps = []
+    parser = EmProgress(steps.append)
+    text = (
+        "Step=    0, Dmax= 1.0e-02 nm, Epot= -1.08e+02 Fmax= 4.60e+01, atom= 2\r"
+        "Step 1, Epot=-1.090000e+02, Fnorm=6.2e+01, Fmax=3.00e+01 (atom 2)\n"
+    )
+    for i in range(0, len(text), 7):  # lines split across chunks
+        parser(text[i : i + 7])
+    assert steps == [
+        {"step": 0, "epot": -108.0, "fmax": 46.0},
+        {"step": 1, "epot": -109.0, "fmax": 30.0},
+    ]
+
+    steps.clear()
+    outputs = OptimGmxComponent.compute(water_input(), progress=steps.append)
+    assert outputs.success
+    assert steps and steps[-1]["fmax"] == outputs.extras["fmax"][-1]
+
+
+def test_cascade():
+    """Checks the stages of a cascade run one after another."""
+    stages = [
+        {"method": "steepest descent", "tol": 1000},
+        {"method": "conjugate gradient", "tol": 100, "max_steps": 20},
+    ]
+    inputs = water_input(extras={"stages": stages})
+    prep = PrepGmxComponent(name="PrepGmxComponent")
+    first, last = [
+        prep.mdp_options(inputs, stage, last=i == 1)
+        for i, stage in enumerate(prep.stages(inputs))
+    ]
+    assert (first["integrator"], first["nsteps"], first["nstxout"]) == ("steep", 10, 0)
+    assert (last["integrator"], last["emtol"], last["nsteps"]) == ("cg", 100, 20)
+    assert "nstxout" not in last
+
+    outputs = OptimGmxComponent.compute(inputs)
+    assert outputs.success
+    assert len(outputs.extras["stages"]) == 2
+    assert outputs.extras["stages"][-1] == outputs.extras["log"]
+
+    with pytest.raises(ValueError):
+        prep.stages(water_input(extras={"stages": [{"integrator": "cg"}]}))
+
+
+def test_lbfgs(tmp_path):
+    """Checks l-bfgs options and the integrator picked for "auto"."""
+    inputs = water_input(method="l-bfgs", extras={"nbfgscorr": 5})
+    prep = PrepGmxComponent(name="PrepGmxComponent")
+    mdp = prep.mdp_options(inputs, prep.stages(inputs)[0])
+    assert (mdp["integrator"], mdp["nbfgscorr"]) == ("l-bfgs", 5)
+    assert OptimGmxComponent.compute(inputs).success
+
+    top_file = tmp_path / "topol.top"
+    (tmp_path / "water.itp").write_text("[ moleculetype ]\n[ settles ]\n")
+    top_file.write_text('#include "water.itp"\n[ system ]\n')
+    assert has_constraints(str(top_file))
+    inputs = water_input(method="auto")
+    mdp = prep.mdp_options(inputs, prep.stages(inputs)[0], top_file=str(top_file))
+    assert mdp["integrator"] == "steep"
+    assert select_integrator(100) == "cg"  # no size threshold measured yet
+    assert select_integrator(10 ** 6) == "cg"
+
+
+def test_multi_molecule():
+    """
+    Checks all molecules are minimized together and split back by key,
+    with the copy of water sharing its moleculetype.
+    """
+    mol = mmelemental.models.Molecule.from_file(mm_data.mols["water-mol.json"])
+    ff = mmelemental.models.ForceField.from_file(mm_data.ffs["water-ff.json"])
+    other = mol.copy(update={"geometry": mol.geometry + 5.0})
+    inputs = water_input(
+        molecule={"water": mol, "other": other},
+        forcefield={"water": ff, "other": ff},
+        cell=None,
+    )
+
+    prep = PrepGmxComponent.compute(inputs)
+    with open(prep.forcefield) as fp:
+        molecules = fp.read().split("[ molecules ]")[-1].split()
+    PrepGmxComponent.cleanup([prep.molecule, prep.mdp_file, prep.forcefield])
+    assert molecules[-2:] == ["water", "2"]
+
+    outputs = OptimGmxComponent.compute(inputs)
+    assert outputs.success
+    assert list(outputs.molecule) == ["water", "other"]
+    for key, out in outputs.molecule.items():
+        assert out.symbols.tolist() == inputs.molecule[key].symbols.tolist()
+    assert (
+        numpy.linalg.norm(
+            outputs.molecule["other"].geometry - outputs.molecule["water"].geometry
+        )
+        > 5.0
+    )
+
+
+def test_postprocess_single(tmp_path):
+    """
+    Checks a single molecule is read back like several are: a copy of the
+    input molecule with the final coordinates in its own units.
+    """
+    inputs = water_input()
+    mol = inputs.molecule["mol"]
+    gro_file, scratch_dir = tmp_path / "confout.gro", tmp_path / "scratch"
+    scratch_dir.mkdir()
+    write_gro(mol, str(gro_file))
+    output = ComputeGmxOutput(
+        proc_input=inputs, molecule=str(gro_file), scratch_dir=str(scratch_dir)
+    )
+
+    out = PostGmxComponent.compute(output).molecule["mol"]
+    assert out.geometry_units == mol.geometry_units
+    assert out.symbols.tolist() == mol.symbols.tolist()
+    assert numpy.array_equal(out.connectivity, mol.connectivity)
+    nm = unit_scale("nm", mol.geometry_units)
+    assert numpy.allclose(out.geometry, mol.geometry, atol=1e-3 * nm)
+
+
+def test_translator_single():
+    """Checks translator writers refuse several molecules."""
+    mol = mmelemental.models.Molecule.from_file(mm_data.mols["water-mol.json"])
+    ff = mmelemental.models.ForceField.from_file(mm_data.ffs["water-ff.json"])
+    other = mol.copy(update={"geometry": mol.geometry + 5.0})
+    inputs = water_input(
+        molecule={"water": mol, "other": other},
+        forcefield={"water": ff, "other": ff},
+        cell=None,
+    )
+    for writer in ("gro_writer", "top_writer"):
+        with pytest.raises(ValueError, match="does not combine 2"):
+            OptimGmxComponent.compute(inputs, extras={writer: "mmic_parmed"})
+
+
+def test_moleculetype_dedup(tmp_path):
+    """Checks copies of a molecule share one moleculetype with a count."""
+    mol = mmelemental.models.Molecule.from_file(mm_data.mols["water-mol.json"])
+    ff = mmelemental.models.ForceField.from_file(mm_data.ffs["water-ff.json"])
+    mols = [mol.copy(update={"geometry": mol.geometry + 5.0 * i}) for i in range(3)]
+    top_file = str(tmp_path / "system.top")
+    write_system_top([ff] * 3, top_file, mols=mols, names=["A", "B", "C"])
+
+    with open(top_file) as fp:
+        text = fp.read()
+    assert text.count("[ moleculetype ]") == 1
+    assert text.split("[ molecules ]")[-1].split()[-2:] == ["A", "3"]
+    assert len(set(moleculetype_keys([ff] * 3, mols))) == 1
+
+
+def test_moleculetype_distinct(tmp_path):
+    """Checks distinct molecules get a moleculetype each, written once."""
+    mol = mmelemental.models.Molecule.from_file(mm_data.mols["water-mol.json"])
+    ff = mmelemental.models.ForceField.from_file(mm_data.ffs["water-ff.json"])
+    other = mol.copy(update={"geometry": mol.geometry + 5.0})
+    other_ff = ff.copy(update={"charges": ff.charges * 0.5})
+    top_file = str(tmp_path / "system.top")
+    write_system_top([ff, other_ff], top_file, mols=[mol, other], names=["A", "B"])
+
+    with open(top_file) as fp:
+        text = fp.read()
+    assert text.count("[ moleculetype ]") == 2
+    assert text.split("[ molecules ]")[-1].split()[-4:] == ["A", "1", "B", "1"]
+
+    inputs = water_input(
+        molecule={"water": mol, "other": other},
+        forcefield={"water": ff, "other": other_ff},
+        cell=None,
+    )
+    outputs = OptimGmxComponent.compute(inputs)
+    assert outputs.success and list(outputs.molecule) == ["water", "other"]
+    for key, out in outputs.molecule.items():
+        assert out.symbols.tolist() == inputs.molecule[key].symbols.tolist()
+
+
+def test_packed():
+    """Checks packed inputs run in one mdrun and are split back per input."""
+    inputs = [water_input(), water_input(), water_input()]
+    with pytest.warns(UserWarning, match="cutoff electrostatics instead of PME"):
+        outputs = OptimGmxComponent.compute_packed(inputs, pack_size=2)
+    assert len(outputs) == 3
+    assert all(out.extras["long_forces"] == "Cut-off" for out in outputs)
+    for inp, out in zip(inputs, outputs):
+        assert out.success and list(out.molecule) == ["mol"]
+        assert (
+            out.molecule["mol"].symbols.tolist() == inp.molecule["mol"].symbols.tolist()
+        )
+        assert out.extras["log"]["fmax"] is not None
+    assert [out.extras["packed"] for out in outputs] == [2, 2, 1]
+
+    # Molecules come back where a single run puts them, not in their cell
+    single = OptimGmxComponent.compute(water_input()).molecule["mol"]
+    nm = unit_scale("nm", single.geometry_units)
+    for out in outputs:
+        geo = out.molecule["mol"].geometry
+        assert numpy.allclose(geo, single.geometry, atol=0.05 * nm)
+
+    with pytest.raises(ValueError):
+        OptimGmxComponent.compute_packed([water_input(), water_input(tol=1.0)])
+
+
+def test_ensemble():
+    """Checks conformers are minimized in one mdrun -multidir, in order."""
+    with pytest.raises(ValueError):
+        OptimGmxComponent.compute_ensemble([water_input(), water_input(tol=1.0)])
+    stages = water_input(extras={"stages": [{"method": "steepest descent"}] * 2})
+    with pytest.raises(ValueError, match="Ensembles do not support stages"):
+        OptimGmxComponent.compute_ensemble([stages, stages])
+    if shutil.which("gmx_mpi") is None:
+        pytest.skip("mdrun -multidir needs an MPI build of gmx")
+
+    inputs = []
+    for shift in (0.0, 0.1, 0.2):
+        inp = water_input()
+        mol = inp.molecule["mol"]
+        geometry = numpy.array(mol.geometry, dtype=float)
+        geometry[:3] += shift  # Stretch the first atom's bonds
+        inputs.append(
+            water_input(molecule={"mol": mol.copy(update={"geometry": geometry})})
+        )
+
+    outputs = OptimGmxComponent.compute_ensemble(inputs, config={"ncores": 3})
+    assert len(outputs) == 3
+    for out in outputs:
+        assert out.success and list(out.molecule) == ["mol"]
+        assert out.extras["log"]["fmax"] is not None
+
+
+def test_rerun():
+    """Checks the energies of many frames are computed in one mdrun -rerun."""
+    inp = water_input()
+    geometry = numpy.reshape(inp.molecule["mol"].geometry, (-1, 3))
+    stretched = geometry.copy()
+    stretched[0] += 0.5
+    frames = numpy.array([geometry, stretched, geometry])
+
+    write_trr("frames.trr", frames / 10, numpy.eye(3))
+    trr = TrrFile("frames.trr")
+    assert len(trr) == 3 and trr.natoms == len(geometry)
+    assert numpy.allclose(trr[1]["x"], stretched / 10, atol=1e-6)
+    os.remove("frames.trr")
+
+    energies = OptimGmxComponent.compute_rerun(inp, frames)
+    assert energies["Potential"].shape == (3,)
+    assert energies["Potential"][1] > energies["Potential"][0]
+    assert energies["Potential"][2] == pytest.approx(energies["Potential"][0])
+
+    with pytest.raises(ValueError):
+        OptimGmxComponent.compute_rerun(inp, frames[:, 1:])
+
+
 def test_cleaner():
     """
     This test will figure out if all the files are
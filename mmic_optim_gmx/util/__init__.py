@@ -0,0 +1,37 @@
+from .files import *
+from .cache import *
+from .gmx import *
+from .gro import *
+from .top import *
+from .units import *
+from .box import *
+from .trr import *
+from .edr import *
+from .mdlog import *
+from .hardware import *
+from .pinning import *
+from .scheduler import *
+from .process import *
+from .integrators import *
+from .packing import *
+from . import files, cache, gmx, gro, top, units, box, trr, edr, mdlog
+from . import hardware, pinning, scheduler, process, integrators, packing
+
+__all__ = (
+    files.__all__
+    + cache.__all__
+    + gmx.__all__
+    + gro.__all__
+    + top.__all__
+    + units.__all__
+    + box.__all__
+    + trr.__all__
+    + edr.__all__
+    + mdlog.__all__
+    + hardware.__all__
+    + pinning.__all__
+    + scheduler.__all__
+    + process.__all__
+    + integrators.__all__
+    + packing.__all__
+)
@@ -0,0 +1,88 @@
+from typing import Sequence, Tuple, Union
+from .units import unit_scale
+import numpy
+
+__all__ = ["bounding_box", "cell_box", "box_vectors"]
+
+
+def bounding_box(
+    mol: Union["Molecule", Sequence["Molecule"]], margin: float
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Returns the rectangular box enclosing ``mol`` with ``margin`` nm of
+    clearance on every side, and the offset (nm) that centers the molecule
+    in it. This is what ``gmx editconf -d margin`` does.
+
+    Parameters
+    ----------
+    mol : Molecule or Sequence[Molecule]
+        Molecule with 3D geometry, or the molecules of a system.
+    margin : float
+        Distance in nm between the molecule and the box faces.
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        Box lengths (3,) and offset (3,) to add to the coordinates, in nm.
+    """
+    mols = mol if isinstance(mol, (list, tuple)) else [mol]
+    geo = numpy.concatenate(
+        [
+            numpy.reshape(mol.geometry, (-1, 3)) / unit_scale("nm", mol.geometry_units)
+            for mol in mols
+        ]
+    )
+    lower, upper = geo.min(axis=0), geo.max(axis=0)
+    box = (upper - lower) + 2 * margin
+    return box, box / 2 - (upper + lower) / 2
+
+
+def cell_box(
+    cell: Sequence[float], units: str = "angstrom"
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Converts a simulation cell to a GRO box line and the offset (nm) that
+    moves the cell origin to (0, 0, 0).
+
+    Parameters
+    ----------
+    cell : Sequence[float]
+        Either the corners (xmin, ymin, zmin, xmax, ymax, zmax) of a
+        rectangular cell, or the 9 components (ax, ay, az, bx, by, bz,
+        cx, cy, cz) of triclinic box vectors a, b and c. Box vectors
+        must follow the GROMACS convention ay = az = bz = 0.
+    units : str, optional
+        Length units of ``cell``. Default angstrom.
+
+    Returns
+    -------
+    Tuple[numpy.ndarray, numpy.ndarray]
+        Box line (3 or 9 values in GRO order) and offset (3,), in nm.
+    """
+    cell = numpy.asarray(cell, dtype=float) / unit_scale("nm", units)
+
+    if cell.shape == (6,):
+        lower, upper = cell[:3], cell[3:]
+        return upper - lower, -lower
+
+    if cell.shape == (9,):
+        a, b, c = cell.reshape(3, 3)
+        if a[1] or a[2] or b[2]:
+            raise ValueError("Triclinic box vectors must satisfy ay = az = bz = 0.")
+        box = numpy.array([a[0], b[1], c[2], a[1], a[2], b[0], b[2], c[0], c[1]])
+        if not box[3:].any():
+            box = box[:3]
+        return box, numpy.zeros(3)
+
+    raise ValueError(f"Cell must have 6 or 9 values, got {len(cell)}.")
+
+
+def box_vectors(box: Sequence[float]) -> numpy.ndarray:
+    """Returns the (3, 3) box vectors of a 3 or 9 value GRO box line."""
+    box = numpy.asarray(box, dtype=float)
+    vectors = numpy.diag(box[:3])
+    if len(box) == 9:
+        vectors[0, 1:] = box[3:5]
+        vectors[1, [0, 2]] = box[5:7]
+        vectors[2, :2] = box[7:9]
+    return vectors
@@ -0,0 +1,230 @@
+from typing import Any, Optional, Union
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+
+__all__ = ["FileCache", "ResultCache", "default_cache_dir", "get_result_cache"]
+
+
+def default_cache_dir(name: str) -> str:
+    """
+    Returns the default cache directory for ``name``. The root can
+    be set with the MMIC_OPTIM_GMX_CACHE environment variable and
+    otherwise follows XDG_CACHE_HOME.
+    """
+    root = os.environ.get("MMIC_OPTIM_GMX_CACHE")
+    if not root:
+        xdg = os.environ.get("XDG_CACHE_HOME", os.path.join("~", ".cache"))
+        root = os.path.join(xdg, "mmic_optim_gmx")
+    return os.path.join(os.path.expanduser(root), name)
+
+
+class FileCache:
+    """
+    Content-addressed on-disk cache of files. Entries are keyed by a
+    sha256 digest of their inputs, the total size is capped and the
+    least recently used entries are evicted first. Writes are atomic
+    so the cache can be shared by concurrent processes.
+
+    Parameters
+    ----------
+    path : str
+        Directory where entries are stored. Created if it does not exist.
+    max_size : int, optional
+        Maximum total size of the cache in bytes. Default 1 GiB.
+    suffix : str, optional
+        Extension given to the stored files e.g. ".tpr".
+    """
+
+    def __init__(self, path: str, max_size: int = 2 ** 30, suffix: str = ""):
+        self.path = Path(path)
+        self.max_size = max_size
+        self.suffix = suffix
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(*items: Union[bytes, str]) -> str:
+        """Returns the hex digest of ``items``, each hashed with its length."""
+        m = hashlib.sha256()
+        for item in items:
+            if isinstance(item, str):
+                item = item.encode("utf-8")
+            m.update(len(item).to_bytes(8, "little"))
+            m.update(item)
+        return m.hexdigest()
+
+    def file(self, key: str) -> Path:
+        return self.path / (key + self.suffix)
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the path of the cached file or None on a miss."""
+        fpath = self.file(key)
+        try:
+            os.utime(fpath)  # mark as recently used
+        except FileNotFoundError:
+            return None
+        return str(fpath)
+
+    def put(self, key: str, filename: str) -> str:
+        """Copies ``filename`` into the cache and returns the cached path."""
+        fpath = self.file(key)
+        tmp = self._tmp_file(fpath)
+        shutil.copyfile(filename, tmp)
+        os.replace(tmp, fpath)
+        self.evict()
+        return str(fpath)
+
+    def write(self, key: str, data: bytes) -> str:
+        """Stores ``data`` in the cache and returns the cached path."""
+        fpath = self.file(key)
+        tmp = self._tmp_file(fpath)
+        tmp.write_bytes(data)
+        os.replace(tmp, fpath)
+        self.evict()
+        return str(fpath)
+
+    @staticmethod
+    def _tmp_file(fpath: Path) -> Path:
+        return fpath.with_name(f".{fpath.name}.{os.getpid()}.{threading.get_ident()}")
+
+    def evict(self):
+        """Removes the least recently used entries until the size cap is met."""
+        entries = []
+        for fpath in self.path.glob("*" + self.suffix):
+            if fpath.name.startswith("."):
+                continue  # write in progress
+            try:
+                stat = fpath.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fpath))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, fpath in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                fpath.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def _canonical(obj: Any) -> Any:
+    """Converts models and arrays to plain JSON-serializable data."""
+    if hasattr(obj, "dict") and callable(obj.dict):
+        obj = obj.dict(exclude={"provenance"})
+    if isinstance(obj, dict):
+        return {
+            str(key): _canonical(val) for key, val in obj.items() if key != "provenance"
+        }
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(val) for val in obj]
+    if hasattr(obj, "tolist"):  # numpy arrays and scalars
+        return obj.tolist()
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return str(obj)
+
+
+class ResultCache:
+    """
+    Memoizes optimization outputs in two tiers: an in-process LRU of
+    ``max_entries`` objects and, if ``path`` is given, a persistent
+    :class:`FileCache` of pickled objects shared between processes.
+
+    Parameters
+    ----------
+    path : str, optional
+        Directory of the on-disk tier. Memory only if None.
+    max_entries : int, optional
+        Number of outputs kept in memory. Default 128.
+    max_size : int, optional
+        Maximum size of the on-disk tier in bytes. Default 1 GiB.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = 128,
+        max_size: int = 2 ** 30,
+    ):
+        self.max_entries = max_entries
+        self.disk = FileCache(path, max_size=max_size, suffix=".pkl") if path else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(inputs: Any, *extra: str) -> str:
+        """
+        Returns a canonical hash of an OptimInput: molecules, forcefields,
+        method, tolerance, step size, max steps, boundary, cell, cutoff
+        methods, keywords and extras, plus any ``extra`` strings such as
+        the engine version.
+        """
+        fields = (
+            "engine",
+            "molecule",
+            "forcefield",
+            "method",
+            "tol",
+            "step_size",
+            "max_steps",
+            "boundary",
+            "cell",
+            "short_forces",
+            "long_forces",
+            "keywords",
+            "extras",
+        )
+        data = {field: _canonical(getattr(inputs, field, None)) for field in fields}
+        return FileCache.key(json.dumps(data, sort_keys=True), *extra)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the stored output or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        if self.disk is None:
+            return None
+
+        fpath = self.disk.get(key)
+        if fpath is None:
+            return None
+        try:
+            with open(fpath, "rb") as fp:
+                output = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None  # evicted or partially written by another process
+
+        self._remember(key, output)
+        return output
+
+    def put(self, key: str, output: Any):
+        """Stores ``output`` in both tiers."""
+        self._remember(key, output)
+        if self.disk is not None:
+            self.disk.write(key, pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _remember(self, key: str, output: Any):
+        with self._lock:
+            self._memory[key] = output
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+@lru_cache(maxsize=None)
+def get_result_cache(
+    path: Optional[str] = None, max_entries: int = 128, max_size: int = 2 ** 30
+) -> ResultCache:
+    """Returns the process-wide :class:`ResultCache` for these settings."""
+    return ResultCache(path, max_entries=max_entries, max_size=max_size)
@@ -0,0 +1,130 @@
+from typing import Dict, List, Tuple
+import struct
+import numpy
+
+__all__ = ["read_edr"]
+
+_names_magic = -55555
+_frame_magic = -7777777
+_first_real = -2e10
+# xdr_datatype: int, float, double, int64, char, string
+_block_dtypes = {0: ">i4", 1: ">f4", 2: ">f8", 3: ">i8", 4: ">i4"}
+
+
+def _string(buf: bytes, pos: int) -> Tuple[str, int]:
+    """Reads an XDR string: length int, then chars padded to 4 bytes."""
+    (size,) = struct.unpack_from(">i", buf, pos)
+    pos += 4
+    return buf[pos : pos + size].decode(), pos + -(-size // 4) * 4
+
+
+def _names(buf: bytes) -> Tuple[List[str], int, int]:
+    """Returns the energy term names, the file version and the data offset."""
+    (magic,) = struct.unpack_from(">i", buf, 0)
+    if magic > 0:  # version 1 files start with the number of terms
+        version, nre, pos = 1, magic, 4
+    elif magic == _names_magic:
+        version, nre = struct.unpack_from(">2i", buf, 4)
+        pos = 12
+    else:
+        raise ValueError("Not a valid edr file.")
+
+    names = []
+    for _ in range(nre):
+        name, pos = _string(buf, pos)
+        if version >= 2:
+            _, pos = _string(buf, pos)  # units, always kJ/mol, bar, nm, K...
+        names.append(name)
+    return names, version, pos
+
+
+def _real(buf: bytes, pos: int) -> numpy.dtype:
+    """Detects the precision from the -2e10 marker starting each frame."""
+    for real in (">f4", ">f8"):
+        size = numpy.dtype(real).itemsize
+        (first,) = numpy.frombuffer(buf, real, 1, pos)
+        (magic,) = struct.unpack_from(">i", buf, pos + size)
+        if first == numpy.dtype(real).type(_first_real) and magic == _frame_magic:
+            return numpy.dtype(real)
+    raise NotImplementedError("Only edr files of version 4 or newer are supported.")
+
+
+def read_edr(filename: str) -> Dict[str, numpy.ndarray]:
+    """
+    Reads a GROMACS .edr energy file without calling ``gmx energy``.
+    The file is read into memory in one go and only the frame headers
+    are walked in Python; the energies of each frame are copied into a
+    preallocated (nframes, nterms) array.
+
+    Parameters
+    ----------
+    filename : str
+        Input .edr file.
+
+    Returns
+    -------
+    Dict[str, numpy.ndarray]
+        "Time" (ps) and "Step" arrays plus one array per energy term
+        e.g. "Potential", in GROMACS units (kJ/mol, bar, ...).
+    """
+    with open(filename, "rb") as fp:
+        buf = fp.read()
+
+    names, _, pos = _names(buf)
+    nre, size = len(names), len(buf)
+    real = _real(buf, pos) if pos < size else numpy.dtype(">f4")
+
+    times, steps, offsets, nsums = [], [], [], []
+    while pos + real.itemsize <= size:
+        pos += real.itemsize + 4  # -2e10 marker and magic
+        (version,) = struct.unpack_from(">i", buf, pos)
+        if version < 4:
+            raise NotImplementedError(
+                "Only edr files of version 4 or newer are supported."
+            )
+        t, step, nsum = struct.unpack_from(">dqi", buf, pos + 4)
+        pos += 24
+        pos += 8  # nsteps
+        if version >= 5:
+            pos += 8  # dt
+        nre_frame, _, nblock = struct.unpack_from(">3i", buf, pos)
+        pos += 12
+
+        subblocks = []
+        for _ in range(nblock):
+            _, nsub = struct.unpack_from(">2i", buf, pos)
+            pos += 8
+            for _ in range(nsub):
+                subblocks.append(struct.unpack_from(">2i", buf, pos))
+                pos += 8
+        pos += 12  # e_size and two reserved ints
+
+        offset, nvalues = pos, nre_frame * (3 if nsum > 0 else 1)
+        pos += nvalues * real.itemsize
+        for dtype, nr in subblocks:
+            if dtype == 5:  # strings
+                for _ in range(nr):
+                    _, pos = _string(buf, pos + 4)
+            elif dtype == 4:  # chars are padded to 4 bytes each
+                pos += 4 * nr
+            else:
+                pos += numpy.dtype(_block_dtypes[dtype]).itemsize * nr
+
+        if pos > size:
+            break  # truncated last frame e.g. from a killed run
+        if nre_frame != nre:
+            continue  # frames without energies only carry blocks
+        times.append(t)
+        steps.append(step)
+        offsets.append(offset)
+        nsums.append(nsum)
+
+    energies = numpy.empty((len(offsets), nre))
+    for frame, (offset, nsum) in enumerate(zip(offsets, nsums)):
+        values = numpy.frombuffer(buf, real, nre * (3 if nsum > 0 else 1), offset)
+        # Averages and sums follow each instantaneous value
+        energies[frame] = values[::3] if nsum > 0 else values
+
+    data = {"Time": numpy.array(times), "Step": numpy.array(steps, dtype=int)}
+    data.update(zip(names, energies.T.copy()))
+    return data
@@ -0,0 +1,27 @@
+from typing import Optional
+import os
+import tempfile
+import uuid
+
+__all__ = ["random_file"]
+
+
+def random_file(suffix: str = "", dir: Optional[str] = None) -> str:
+    """
+    Returns a unique file path that does not exist yet.
+
+    Parameters
+    ----------
+    suffix : str, optional
+        File extension e.g. ".gro".
+    dir : str, optional
+        Parent directory. Defaults to tempfile.gettempdir(), which
+        honors a per-process override of tempfile.tempdir.
+
+    Returns
+    -------
+    str
+        Absolute path to the (non-existent) file.
+    """
+    dir = dir or tempfile.gettempdir()
+    return os.path.abspath(os.path.join(dir, "tmp" + uuid.uuid4().hex + suffix))
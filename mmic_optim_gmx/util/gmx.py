@@ -0,0 +1,86 @@
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping
+import subprocess
+
+__all__ = ["gmx_version", "task_config", "mdrun_threads"]
+
+
+@lru_cache(maxsize=None)
+def gmx_version(engine: str = "gmx") -> str:
+    """
+    Returns the version string reported by ``engine --version``
+    e.g. "2021.3", or an empty string if it cannot be determined.
+    """
+    try:
+        proc = subprocess.run(
+            [engine, "--version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+    except OSError:
+        return ""
+
+    for line in proc.stdout.splitlines():
+        if "GROMACS version:" in line:
+            return line.split(":", 1)[1].strip()
+    return ""
+
+
+def task_config(config: Any) -> Dict[str, Any]:
+    """
+    Returns the fields explicitly set on a TaskConfig-like ``config`` as a
+    dict. Accepts pydantic models, mappings and plain objects, or None.
+    """
+    if config is None:
+        return {}
+    if isinstance(config, Mapping):
+        return dict(config)
+    if hasattr(config, "dict"):
+        return config.dict(exclude_unset=True)
+    return {key: val for key, val in vars(config).items() if not key.startswith("_")}
+
+
+def mdrun_threads(config: Any) -> List[str]:
+    """
+    Translates a TaskConfig-like ``config`` into mdrun thread and pinning
+    flags. ``ncores`` becomes -nt, split into -ntmpi ranks of -ntomp
+    threads from ``ntmpi`` and ``ntomp``/``cores_per_rank`` when given and
+    into a single rank otherwise, since small systems cannot be domain
+    decomposed. ``pin`` (bool or "on"/"off"/"auto"), ``pinoffset`` and
+    ``pinstride`` become -pin, -pinoffset and -pinstride; an offset
+    implies -pin on.
+    """
+    config = task_config(config)
+    ncores, ntmpi = config.get("ncores"), config.get("ntmpi")
+    ntomp = config.get("ntomp", config.get("cores_per_rank"))
+
+    if ncores:
+        if ntomp and not ntmpi:
+            ntmpi = max(1, ncores // ntomp)
+        elif ntmpi and not ntomp:
+            ntomp = max(1, ncores // ntmpi)
+        elif not ntmpi and not ntomp:
+            ntmpi, ntomp = 1, ncores
+        ncores = ntmpi * ntomp
+
+    flags = []
+    # MPI builds take their ranks from mpiexec
+    if not config.get("use_mpiexec"):
+        if ncores:
+            flags.extend(["-nt", str(ncores)])
+        if ntmpi:
+            flags.extend(["-ntmpi", str(ntmpi)])
+    if ntomp:
+        flags.extend(["-ntomp", str(ntomp)])
+
+    pin, pinoffset = config.get("pin"), config.get("pinoffset")
+    if pin is None and pinoffset is not None:
+        pin = True
+    if pin is not None:
+        flags.extend(["-pin", {True: "on", False: "off"}.get(pin, pin)])
+    if pinoffset is not None:
+        flags.extend(["-pinoffset", str(pinoffset)])
+    if config.get("pinstride") is not None:
+        flags.extend(["-pinstride", str(config["pinstride"])])
+    return flags
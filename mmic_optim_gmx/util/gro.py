@@ -0,0 +1,210 @@
+from typing import Optional, Sequence, Tuple, Union
+from .units import unit_scale
+import numpy
+
+__all__ = ["write_gro", "read_gro", "write_gro_coords", "residue_arrays"]
+
+_title = "GROningen MAchine for Chemical Simulation"
+
+
+def _column(fmt: str, values: numpy.ndarray, width: int) -> numpy.ndarray:
+    """Formats ``values`` with ``fmt`` and truncates each entry to ``width`` chars."""
+    return numpy.char.mod(fmt, values).astype(f"<U{width}")
+
+
+def residue_arrays(mol: "Molecule") -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Returns per-atom residue names and sequential (1-based) residue numbers
+    of ``mol``. A new residue starts whenever the (name, number) substruct
+    pair changes from one atom to the next.
+    """
+    natoms = len(mol.symbols)
+    subs = mol.substructs
+    if subs is None:
+        return numpy.full(natoms, "UNK"), numpy.ones(natoms, dtype=int)
+
+    subs = numpy.asarray(subs)
+    if subs.dtype.names:
+        names, nums = subs[subs.dtype.names[0]], subs[subs.dtype.names[1]]
+    else:
+        names, nums = subs[:, 0], subs[:, 1].astype(int)
+
+    names = names.astype(str)
+    change = (names[1:] != names[:-1]) | (nums[1:] != nums[:-1])
+    resids = numpy.concatenate(([1], 1 + numpy.cumsum(change)))
+    return names, resids
+
+
+def atom_names(mol: "Molecule") -> numpy.ndarray:
+    """Returns the atom labels of ``mol``, or its symbols if unlabeled."""
+    labels = mol.atom_labels
+    if labels is not None and any(label != "" for label in labels):
+        return numpy.asarray(labels, dtype=str)
+    return numpy.asarray(mol.symbols, dtype=str)
+
+
+def _atom_lines(
+    mol: "Molecule",
+    geo: numpy.ndarray,
+    first_atom: int,
+    first_res: int,
+    precision: int,
+    velocities: bool,
+) -> Tuple[numpy.ndarray, int]:
+    """
+    Formats the GRO lines of ``mol`` with coordinates ``geo`` (nm), numbering
+    atoms from ``first_atom`` and residues from ``first_res``. Returns the
+    lines and the last residue number.
+    """
+    natoms = len(mol.symbols)
+    resnames, resids = residue_arrays(mol)
+    resids = resids + first_res - 1
+    width = 5 + precision
+
+    line = numpy.char.add(
+        _column("%5d", resids % 100000, 5), _column("%-5s", resnames.astype("<U5"), 5)
+    )
+    line = numpy.char.add(line, _column("%5s", atom_names(mol).astype("<U5"), 5))
+    atoms = numpy.arange(first_atom, first_atom + natoms)
+    line = numpy.char.add(line, _column("%5d", atoms % 100000, 5))
+    for dim in range(3):
+        line = numpy.char.add(
+            line, _column(f"%{width}.{precision}f", geo[:, dim], width)
+        )
+
+    if velocities:
+        vel = numpy.reshape(mol.velocities, (natoms, 3))
+        nm_ps = unit_scale("nm/ps", mol.velocities_units)
+        for dim in range(3):
+            line = numpy.char.add(
+                line, _column(f"%{width}.{precision + 1}f", vel[:, dim] / nm_ps, width)
+            )
+    return line, resids[-1] if natoms else first_res - 1
+
+
+def write_gro(
+    mol: Union["Molecule", Sequence["Molecule"]],
+    filename: str,
+    box: Optional[Sequence[float]] = None,
+    offset: Optional[Sequence[float]] = None,
+    precision: int = 3,
+):
+    """
+    Writes a Molecule to a GRO file. Columns are formatted with NumPy
+    and the geometry is converted to nm in a single pass, producing the
+    same layout as ParmEd's GRO writer.
+
+    Parameters
+    ----------
+    mol : Molecule or Sequence[Molecule]
+        Molecule with 3D geometry, or several written one after the other
+        as a single system with continuous atom and residue numbers.
+    filename : str
+        Output .gro file.
+    box : Sequence[float], optional
+        Box line in nm: 3 values for a rectangular box or the 9 GRO
+        triclinic values. Defaults to the molecule extent padded by 0.5 nm.
+    offset : Sequence[float], optional
+        Translation in nm applied to the coordinates e.g. to center
+        the molecule in ``box``.
+    precision : int, optional
+        Number of decimals for coordinates. Default 3.
+    """
+    mols = list(mol) if isinstance(mol, (list, tuple)) else [mol]
+    if any(mol.ndim != 3 for mol in mols):
+        raise NotImplementedError("Only 3D molecules can be written to GRO files.")
+
+    # Divide by the size of a nm in the input units, like ParmEd does for angstroms
+    geos = [
+        numpy.reshape(mol.geometry, (-1, 3)) / unit_scale("nm", mol.geometry_units)
+        for mol in mols
+    ]
+    raw = numpy.concatenate(geos) if geos else numpy.zeros((0, 3))
+    natoms = len(raw)
+    velocities = bool(mols) and all(mol.velocities is not None for mol in mols)
+
+    lines, natom, nres = [], 1, 0
+    for mol, geo in zip(mols, geos):
+        if offset is not None:
+            geo = geo + numpy.asarray(offset)
+        line, nres = _atom_lines(mol, geo, natom, nres + 1, precision, velocities)
+        lines.extend(line.tolist())
+        natom += len(geo)
+
+    if box is None:
+        box = raw.max(axis=0) - raw.min(axis=0) + 0.5 if natoms else ()
+
+    with open(filename, "w") as fp:
+        fp.write(f"{_title}\n{natoms:5d}\n")
+        if natoms:
+            fp.write("\n".join(lines))
+            fp.write("\n")
+        if len(box):
+            fp.write("".join(f"{val:10.5f}" for val in box) + "\n")
+
+
+def read_gro(filename: str) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Reads the coordinates (natoms, 3) and the box line of a GRO file, both
+    in nm. The coordinate precision is taken from the decimal points.
+    """
+    with open(filename) as fp:
+        lines = fp.read().splitlines()
+
+    natoms = int(lines[1])
+    atoms = lines[2 : 2 + natoms]
+    if not natoms:
+        return numpy.zeros((0, 3)), numpy.array(lines[2].split(), dtype=float)
+
+    first = atoms[0]
+    width = first.index(".", first.index(".", 20) + 1) - first.index(".", 20)
+    geo = numpy.array(
+        [
+            [line[20 + dim * width : 20 + (dim + 1) * width] for dim in range(3)]
+            for line in atoms
+        ],
+        dtype=float,
+    )
+    return geo, numpy.array(lines[2 + natoms].split(), dtype=float)
+
+
+def write_gro_coords(
+    template: str,
+    filename: str,
+    coords: numpy.ndarray,
+    box: Optional[numpy.ndarray] = None,
+    precision: int = 3,
+):
+    """
+    Writes the atoms of the GRO file ``template`` with new coordinates
+    (natoms, 3) in nm, e.g. a trajectory frame, and the (3, 3) box vectors
+    in nm, by default the box of ``template``. Velocities are not written.
+    """
+    with open(template) as fp:
+        lines = fp.read().splitlines()
+    natoms = int(lines[1])
+    width = 5 + precision
+
+    line = numpy.array([atom[:20] for atom in lines[2 : 2 + natoms]], dtype="<U20")
+    for dim in range(3):
+        line = numpy.char.add(
+            line, _column(f"%{width}.{precision}f", coords[:, dim], width)
+        )
+
+    if box is None:
+        box_line = lines[2 + natoms]
+    else:
+        # GRO box line: v1(x) v2(y) v3(z) v1(y) v1(z) v2(x) v2(z) v3(x) v3(y)
+        box = numpy.asarray(box, dtype=float)
+        values = [box[0, 0], box[1, 1], box[2, 2]]
+        triclinic = [box[0, 1], box[0, 2], box[1, 0], box[1, 2], box[2, 0], box[2, 1]]
+        if any(triclinic):
+            values.extend(triclinic)
+        box_line = "".join(f"{val:10.5f}" for val in values)
+
+    with open(filename, "w") as fp:
+        fp.write(f"{lines[0]}\n{natoms:5d}\n")
+        if natoms:
+            fp.write("\n".join(line.tolist()))
+            fp.write("\n")
+        fp.write(box_line + "\n")
@@ -0,0 +1,140 @@
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+import math
+import os
+
+__all__ = ["Hardware", "discover_hardware", "available_cores", "available_workers"]
+
+_cgroup_root = "/sys/fs/cgroup"
+# cgroup v1 reports "no limit" as a huge page-aligned number
+_v1_unlimited = 2 ** 60
+
+
+class Hardware(NamedTuple):
+    """Resources available to this process."""
+
+    cpus: Tuple[int, ...]  # CPU ids in the affinity mask
+    cpu_quota: Optional[float]  # cgroup CPU quota in cores, None if unlimited
+    memory: Optional[int]  # bytes, the cgroup limit or the physical memory
+
+    @property
+    def ncores(self) -> int:
+        """
+        Number of cores the process can keep busy. A fractional quota is
+        rounded down, since a thread more than the quota would be throttled.
+        """
+        ncores = len(self.cpus)
+        if self.cpu_quota is not None:
+            ncores = min(ncores, math.floor(self.cpu_quota))
+        return max(1, ncores)
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as fp:
+            return fp.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroups() -> List[Tuple[str, str]]:
+    """Returns (controllers, path) pairs from /proc/self/cgroup."""
+    text = _read("/proc/self/cgroup") or ""
+    groups = []
+    for line in text.splitlines():
+        _, controllers, path = line.split(":", 2)
+        groups.append((controllers, path))
+    return groups
+
+
+def _ancestors(root: str, path: str) -> List[str]:
+    """Returns the directories from ``root/path`` up to ``root``."""
+    dirs = [root]
+    parts = [part for part in path.split("/") if part]
+    for i in range(len(parts)):
+        dirs.append(os.path.join(root, *parts[: i + 1]))
+    return dirs[::-1]
+
+
+def _v1_dirs(controller: str) -> List[str]:
+    for controllers, path in _cgroups():
+        if controller in controllers.split(","):
+            for name in (controllers, controller):
+                root = os.path.join(_cgroup_root, name)
+                if os.path.isdir(root):
+                    return _ancestors(root, path)
+    return []
+
+
+def _v2_dirs() -> List[str]:
+    for controllers, path in _cgroups():
+        if controllers == "":
+            return _ancestors(_cgroup_root, path)
+    return []
+
+
+def _cpu_quota() -> Optional[float]:
+    """Smallest CPU quota in cores of this cgroup and its parents."""
+    quotas = []
+    for path in _v2_dirs():
+        text = _read(os.path.join(path, "cpu.max"))
+        if text:
+            quota, _, period = text.partition(" ")
+            if quota != "max":
+                quotas.append(int(quota) / int(period or 100000))
+    for path in _v1_dirs("cpu"):
+        quota = _read(os.path.join(path, "cpu.cfs_quota_us"))
+        period = _read(os.path.join(path, "cpu.cfs_period_us"))
+        if quota and period and int(quota) > 0:
+            quotas.append(int(quota) / int(period))
+    return min(quotas) if quotas else None
+
+
+def _memory() -> Optional[int]:
+    """Smallest memory limit of this cgroup and its parents, else the RAM."""
+    limits = []
+    for path in _v2_dirs():
+        text = _read(os.path.join(path, "memory.max"))
+        if text and text != "max":
+            limits.append(int(text))
+    for path in _v1_dirs("memory"):
+        text = _read(os.path.join(path, "memory.limit_in_bytes"))
+        if text and int(text) < _v1_unlimited:
+            limits.append(int(text))
+
+    try:
+        limits.append(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES"))
+    except (AttributeError, ValueError, OSError):
+        pass
+    return min(limits) if limits else None
+
+
+@lru_cache(maxsize=None)
+def discover_hardware() -> Hardware:
+    """
+    Discovers the CPUs and memory this process may use: the affinity mask,
+    the cgroup v1/v2 CPU quota and the cgroup memory limit, so that thread
+    and worker counts do not oversubscribe containers.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = tuple(sorted(os.sched_getaffinity(0)))
+    else:
+        cpus = tuple(range(os.cpu_count() or 1))
+    return Hardware(cpus=cpus, cpu_quota=_cpu_quota(), memory=_memory())
+
+
+def available_cores() -> int:
+    """Number of cores available to this process, see :func:`discover_hardware`."""
+    return discover_hardware().ncores
+
+
+def available_workers(memory_per_worker: int) -> int:
+    """
+    Number of workers, each using up to ``memory_per_worker`` bytes, that
+    fit in the cores and memory available to this process, at least one.
+    """
+    hardware = discover_hardware()
+    workers = hardware.ncores
+    if hardware.memory is not None:
+        workers = min(workers, hardware.memory // memory_per_worker)
+    return max(1, workers)
@@ -0,0 +1,68 @@
+from typing import Optional
+import os
+import re
+
+__all__ = ["em_integrator", "has_constraints", "select_integrator"]
+
+# Largest system minimized with l-bfgs by the "auto" method. l-bfgs takes
+# the fewest force evaluations but runs on a single rank and keeps
+# 2 * nbfgscorr coordinate vectors, so beyond some size cg scales better.
+# None until that crossover is measured with devtools/scripts/bench_methods.py,
+# and until then "auto" does not switch integrators by size.
+_lbfgs_max_atoms: Optional[int] = None
+_section = re.compile(r"^\s*\[\s*(\w+)\s*\]", re.MULTILINE)
+_include = re.compile(r'^\s*#include\s+"([^"]+)"', re.MULTILINE)
+
+
+def em_integrator(method: Optional[str]) -> Optional[str]:
+    """
+    Translates an OptimInput method e.g. "steepest descent", "conjugate
+    gradient" or "lbfgs" into a gmx integrator. Unknown names, including
+    "auto", are returned unchanged.
+    """
+    if method is None:
+        return None
+    name = method.lower()
+    if "steep" in name:
+        return "steep"
+    if "conjugate" in name or name == "cg":
+        return "cg"
+    if "bfgs" in name:
+        return "l-bfgs"
+    return method
+
+
+def has_constraints(top_file: str) -> bool:
+    """
+    Whether the topology, or a local file it includes, has constraints or
+    settles sections. Includes gmx resolves from its own library are not
+    followed. Preprocessor conditionals are ignored.
+    """
+    seen, files = set(), [os.path.abspath(top_file)]
+    while files:
+        fname = files.pop()
+        if fname in seen or not os.path.isfile(fname):
+            continue
+        seen.add(fname)
+        with open(fname) as fp:
+            text = fp.read()
+        sections = {name.lower() for name in _section.findall(text)}
+        if sections & {"constraints", "settles"}:
+            return True
+        files.extend(
+            os.path.join(os.path.dirname(fname), inc) for inc in _include.findall(text)
+        )
+    return False
+
+
+def select_integrator(natoms: int, constrained: bool = False) -> str:
+    """
+    Picks an integrator for the "auto" method: steep if the system has
+    constraints, which cg and l-bfgs do not support, and cg otherwise.
+    Once ``_lbfgs_max_atoms`` is set, systems up to that size get l-bfgs.
+    """
+    if constrained:
+        return "steep"
+    if _lbfgs_max_atoms is not None and natoms <= _lbfgs_max_atoms:
+        return "l-bfgs"
+    return "cg"
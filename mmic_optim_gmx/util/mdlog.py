@@ -0,0 +1,142 @@
+from typing import Any, Callable, Dict
+import re
+import numpy
+
+__all__ = ["parse_em_steps", "EmProgress", "parse_em_log"]
+
+# Progress lines of mdrun -v e.g.
+# steep: "Step=   14, Dmax= 1.2e-02 nm, Epot= -1.08011e+02 Fmax= 4.60530e+01, atom= 2"
+# cg/l-bfgs: "Step 14, Epot=-1.080110e+02, Fnorm=6.215e+01, Fmax=4.605e+01 (atom 2)"
+_em_step = re.compile(
+    r"Step[=\s]\s*(?P<step>\d+),.*?Epot=\s*(?P<epot>\S+?),?\s.*?"
+    r"Fmax=\s*(?P<fmax>[-+.\deE]+)"
+)
+
+
+def parse_em_steps(text: str) -> Dict[str, numpy.ndarray]:
+    """
+    Parses the per-step progress printed by ``mdrun -v`` during energy
+    minimization into "step", "epot" (kJ/mol) and "fmax" (kJ/mol/nm)
+    arrays. Only the last report of each step is kept.
+    """
+    rows = {}
+    for match in _em_step.finditer(text):
+        rows[int(match["step"])] = (float(match["epot"]), float(match["fmax"]))
+
+    steps = numpy.array(sorted(rows), dtype=int)
+    values = numpy.array([rows[step] for step in steps], dtype=float).reshape(-1, 2)
+    return {"step": steps, "epot": values[:, 0], "fmax": values[:, 1]}
+
+
+class EmProgress:
+    """
+    Incremental parser of the ``mdrun -v`` output, fed with chunks of
+    stderr while mdrun runs. ``callback`` is called with a dict of "step",
+    "epot" (kJ/mol) and "fmax" (kJ/mol/nm) for every progress line as it
+    completes. mdrun ends these lines with a carriage return instead of a
+    newline, so both are treated as line ends.
+    """
+
+    def __init__(self, callback: Callable[[Dict[str, Any]], Any]):
+        self.callback = callback
+        self._buffer = ""
+
+    def __call__(self, text: str):
+        lines = re.split(r"[\r\n]", self._buffer + text)
+        self._buffer = lines.pop()
+        for line in lines:
+            match = _em_step.search(line)
+            if match:
+                self.callback(
+                    {
+                        "step": int(match["step"]),
+                        "epot": float(match["epot"]),
+                        "fmax": float(match["fmax"]),
+                    }
+                )
+
+
+# Summary printed at the end of a minimization e.g.
+# "Steepest Descents converged to Fmax < 1000 in 12 steps"
+# "Potential Energy  = -1.0919458e+02"
+# "Maximum force     =  6.3185760e+02 on atom 2"
+_em_summary = re.compile(
+    r"^(?P<method>.+?) (?P<result>converged to Fmax|converged to machine precision"
+    r"|did not converge to Fmax) .*?in (?P<steps>\d+) steps",
+    re.MULTILINE,
+)
+_epot = re.compile(r"^Potential Energy\s+=\s*(\S+)", re.MULTILINE)
+_fmax = re.compile(r"^Maximum force\s+=\s*(\S+) on atom (\d+)", re.MULTILINE)
+_fnorm = re.compile(r"^Norm of force\s+=\s*(\S+)", re.MULTILINE)
+_time = re.compile(r"^\s*Time:\s+(\S+)\s+(\S+)", re.MULTILINE)
+_convergence = {
+    "converged to Fmax": "fmax",
+    "converged to machine precision": "machine_precision",
+    "did not converge to Fmax": "max_steps",
+}
+_timing_columns = ("ranks", "threads", "calls", "wall_time", "giga_cycles", "percent")
+
+
+def _timings(text: str) -> Dict[str, Dict[str, float]]:
+    """Parses the first table of the cycle and time accounting section."""
+    start = text.find("R E A L   C Y C L E   A N D   T I M E")
+    if start < 0:
+        return {}
+
+    timings, dashes = {}, 0
+    for line in text[start:].splitlines():
+        if line.startswith("-----"):
+            dashes += 1
+            if dashes == 3:  # header, body, total
+                break
+            continue
+        if not dashes:
+            continue
+
+        tokens = line.split()
+        values = []
+        while tokens:
+            try:
+                values.insert(0, float(tokens[-1]))
+            except ValueError:
+                break
+            tokens.pop()
+        if tokens and values:
+            # Totals only have the last three columns
+            timings[" ".join(tokens)] = dict(
+                zip(_timing_columns[-len(values) :], values)
+            )
+    return timings
+
+
+def parse_em_log(text: str) -> Dict[str, Any]:
+    """
+    Parses the summary of an energy minimization md.log.
+
+    Returns
+    -------
+    Dict[str, Any]
+        "convergence" ("fmax", "machine_precision" or "max_steps"),
+        "converged" (True if Fmax < emtol was reached), "nsteps", "epot"
+        (kJ/mol), "fmax" (kJ/mol/nm), "fmax_atom" (1-based), "fnorm",
+        "core_time" and "wall_time" (s), and "timings", the cycle and time
+        accounting table keyed by row e.g. "Force" or "Total". Entries the
+        log does not contain, e.g. after a crash, are None.
+    """
+    summary = _em_summary.search(text)
+    convergence = _convergence[summary["result"]] if summary else None
+    epot, fmax, fnorm = _epot.search(text), _fmax.search(text), _fnorm.search(text)
+    time = _time.search(text)
+
+    return {
+        "convergence": convergence,
+        "converged": convergence == "fmax" if summary else None,
+        "nsteps": int(summary["steps"]) if summary else None,
+        "epot": float(epot[1]) if epot else None,
+        "fmax": float(fmax[1]) if fmax else None,
+        "fmax_atom": int(fmax[2]) if fmax else None,
+        "fnorm": float(fnorm[1]) if fnorm else None,
+        "core_time": float(time[1]) if time else None,
+        "wall_time": float(time[2]) if time else None,
+        "timings": _timings(text),
+    }
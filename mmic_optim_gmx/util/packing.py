@@ -0,0 +1,60 @@
+from typing import List, Sequence, Tuple
+from .units import unit_scale
+import numpy
+
+__all__ = ["pack_molecules"]
+
+
+def pack_molecules(
+    groups: Sequence[Sequence["Molecule"]], gap: float
+) -> Tuple[List[List["Molecule"]], numpy.ndarray]:
+    """
+    Places groups of molecules on a grid, each group centered in its own
+    cell, so that atoms of different groups are at least ``gap`` nm apart,
+    also across periodic images of the returned box.
+
+    Parameters
+    ----------
+    groups : Sequence[Sequence[Molecule]]
+        Molecules that keep their relative positions, e.g. the molecules
+        of one OptimInput.
+    gap : float
+        Minimum distance in nm between groups.
+
+    Returns
+    -------
+    Tuple[List[List[Molecule]], numpy.ndarray]
+        Translated copies of the molecules of each group, in their own
+        geometry units, and the box lengths (3,) in nm.
+    """
+    scales = [
+        [unit_scale("nm", mol.geometry_units) for mol in group] for group in groups
+    ]
+    geos = [
+        [numpy.reshape(mol.geometry, (-1, 3)) / scale for mol, scale in zip(group, gs)]
+        for group, gs in zip(groups, scales)
+    ]
+    lower = numpy.array([numpy.concatenate(geo).min(axis=0) for geo in geos])
+    upper = numpy.array([numpy.concatenate(geo).max(axis=0) for geo in geos])
+
+    # Cells fit the largest group, on a grid as close to a cube as possible
+    cell = (upper - lower).max(axis=0) + gap
+    nx = int(numpy.ceil(len(groups) ** (1 / 3)))
+    shape = (nx, nx, int(numpy.ceil(len(groups) / nx ** 2)))
+    index = numpy.stack(numpy.unravel_index(numpy.arange(len(groups)), shape), axis=1)
+    shifts = (index + 0.5) * cell - (upper + lower) / 2
+
+    packed = [
+        [
+            mol.copy(
+                update={
+                    "geometry": ((geo + shift) * scale).reshape(
+                        numpy.shape(mol.geometry)
+                    )
+                }
+            )
+            for mol, geo, scale in zip(group, geo_group, scale_group)
+        ]
+        for group, geo_group, scale_group, shift in zip(groups, geos, scales, shifts)
+    ]
+    return packed, numpy.array(shape) * cell
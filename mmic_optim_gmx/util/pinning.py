@@ -0,0 +1,195 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from glob import glob
+from .hardware import discover_hardware
+import os
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover, not available on Windows
+    fcntl = None
+
+__all__ = ["parse_cpulist", "numa_nodes", "physical_cores", "CoreAllocator"]
+
+_cpu_root = "/sys/devices/system/cpu"
+
+
+def parse_cpulist(text: str) -> List[int]:
+    """Parses a Linux cpulist e.g. "0-3,8,10-11" into a list of CPU ids."""
+    cpus = []
+    for item in text.strip().split(","):
+        if not item:
+            continue
+        first, _, last = item.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def numa_nodes(cpus: Optional[Sequence[int]] = None) -> List[List[int]]:
+    """
+    Returns the CPUs of each NUMA node restricted to ``cpus``, which
+    defaults to the CPUs this process may run on. Falls back to a single
+    node if the topology cannot be read from sysfs.
+    """
+    if cpus is None:
+        cpus = discover_hardware().cpus
+    allowed = set(cpus)
+
+    nodes = []
+    for path in sorted(glob("/sys/devices/system/node/node[0-9]*/cpulist")):
+        try:
+            with open(path) as fp:
+                node = [cpu for cpu in parse_cpulist(fp.read()) if cpu in allowed]
+        except (OSError, ValueError):
+            continue
+        if node:
+            nodes.append(node)
+
+    covered = {cpu for node in nodes for cpu in node}
+    if covered != allowed:
+        return [sorted(allowed)]
+    return nodes
+
+
+def _read_int(path: str) -> int:
+    with open(path) as fp:
+        return int(fp.read())
+
+
+def physical_cores() -> Optional[List[List[int]]]:
+    """
+    Returns the CPU ids of the hardware threads of each physical core of
+    the machine, ordered by package, core and thread. This is the order
+    in which mdrun numbers logical cores for -pinoffset. Returns None if
+    the topology cannot be read from sysfs.
+    """
+    try:
+        with open(os.path.join(_cpu_root, "online")) as fp:
+            cpus = parse_cpulist(fp.read())
+        keys = {}
+        for cpu in cpus:
+            topology = os.path.join(_cpu_root, f"cpu{cpu}", "topology")
+            package = _read_int(os.path.join(topology, "physical_package_id"))
+            keys[cpu] = (package, _read_int(os.path.join(topology, "core_id")))
+    except (OSError, ValueError):
+        return None
+
+    cores = {}
+    for cpu in sorted(cpus, key=lambda cpu: (keys[cpu], cpu)):
+        cores.setdefault(keys[cpu], []).append(cpu)
+    return list(cores.values())
+
+
+def _lock_dir() -> str:
+    """
+    A node-local directory for core locks: cluster home and cache
+    directories are often shared over NFS between nodes.
+    """
+    root = "/dev/shm" if os.access("/dev/shm", os.W_OK) else None
+    root = root or os.environ.get("TMPDIR") or "/tmp"
+    user = os.getuid() if hasattr(os, "getuid") else ""
+    return os.path.join(root, f"mmic_optim_gmx-cores-{user}")
+
+
+class CoreAllocator:
+    """
+    Hands out disjoint blocks of consecutive cores to concurrent mdrun
+    processes, which may live in different Python processes. Each CPU
+    is guarded by an advisory lock file, so cores are released when the
+    run finishes, fails or its process dies. Blocks never straddle NUMA
+    nodes and start at a physical core, whose hardware threads are all
+    reserved, so concurrent runs never share a physical core.
+
+    Parameters
+    ----------
+    path : str, optional
+        Directory of the lock files, shared by all cooperating processes
+        on the node. Defaults to a directory in /dev/shm or $TMPDIR.
+    nodes : List[List[int]], optional
+        CPU ids per NUMA node. Detected with :func:`numa_nodes` by default.
+    cores : List[List[int]], optional
+        CPU ids per physical core in mdrun order, see
+        :func:`physical_cores`. Detected by default; if the topology is
+        unknown no cores are handed out.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        nodes: Optional[List[List[int]]] = None,
+        cores: Optional[List[List[int]]] = None,
+    ):
+        self.path = path or _lock_dir()
+        self.nodes = nodes if nodes is not None else numa_nodes()
+        self.cores = cores if cores is not None else physical_cores() or []
+        os.makedirs(self.path, exist_ok=True)
+
+        # mdrun logical core index and physical core of each CPU id
+        self._index, self._core = {}, {}
+        for core in self.cores:
+            for cpu in core:
+                self._index[cpu], self._core[cpu] = len(self._index), core
+
+    def _blocks(self, ncores: int) -> Iterator[Tuple[List[int], List[int]]]:
+        """
+        Yields candidate blocks of CPU ids: ``ncores`` consecutive logical
+        cores starting at a physical core, each with the CPUs to lock.
+        """
+        for node in self.nodes:
+            node = sorted(
+                (cpu for cpu in node if cpu in self._index), key=self._index.get
+            )
+            allowed = set(node)
+            for start in range(len(node) - ncores + 1):
+                block = node[start : start + ncores]
+                if start and self._core[node[start - 1]] is self._core[block[0]]:
+                    continue  # not the first thread of a physical core
+                if self._index[block[-1]] - self._index[block[0]] != ncores - 1:
+                    continue
+                locked = {cpu for b in block for cpu in self._core[b]} & allowed
+                yield block, sorted(locked)
+
+    def _lock(self, cpu: int) -> Optional[int]:
+        fd = os.open(os.path.join(self.path, f"cpu{cpu}.lock"), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    @staticmethod
+    def _unlock(fds: List[int]):
+        for fd in fds:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @contextmanager
+    def allocate(self, ncores: int) -> Iterator[Dict[str, int]]:
+        """
+        Reserves ``ncores`` consecutive cores for the duration of the
+        context and yields the matching mdrun pinning options, i.e.
+        {"pin": True, "pinoffset": first logical core, "pinstride": 1}.
+        Yields an empty dict, leaving pinning to mdrun, if no block is free.
+        """
+        fds = []
+        if fcntl is not None and ncores > 0:
+            for block, locked in self._blocks(ncores):
+                for cpu in locked:
+                    fd = self._lock(cpu)
+                    if fd is None:
+                        break
+                    fds.append(fd)
+                if len(fds) == len(locked):
+                    break
+                self._unlock(fds)
+                fds = []
+
+        try:
+            if fds:
+                offset = self._index[block[0]]
+                yield {"pin": True, "pinoffset": offset, "pinstride": 1}
+            else:
+                yield {}
+        finally:
+            self._unlock(fds)
@@ -0,0 +1,299 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Generator, List, Optional
+import asyncio
+import codecs
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+__all__ = [
+    "Steps",
+    "remaining",
+    "tail",
+    "run_command",
+    "run_command_async",
+    "drive",
+    "drive_async",
+]
+
+# A stage yields CmdComponent input dicts, is sent back their output
+# dicts and finally returns its result. Commands yielded together in a
+# list run concurrently and are sent back a list of outputs.
+Steps = Generator[Any, Any, Any]
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """
+    Seconds left until the ``time.monotonic`` ``deadline``, None without a
+    deadline. Raises TimeoutError once it has passed.
+    """
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("The time budget of the minimization is used up.")
+    return left
+
+
+def tail(text: str, nlines: int = 20) -> str:
+    """Returns the last ``nlines`` lines of ``text``, where gmx prints errors."""
+    return "\n".join(text.rstrip().splitlines()[-nlines:])
+
+
+def _check(cmd_input: Dict[str, Any], output: Dict[str, Any], success: bool = True):
+    """Raises RuntimeError with the end of stderr if the command failed."""
+    returncode = output.get("returncode")
+    if success and not returncode:
+        return
+    status = f" with exit code {returncode}" if returncode else ""
+    raise RuntimeError(
+        f"{' '.join(map(str, cmd_input['command'][:2]))} failed{status}:\n"
+        f"{tail(output.get('stderr') or '')}"
+    )
+
+
+def _timed_out(cmd_input: Dict[str, Any], timeout: float) -> TimeoutError:
+    return TimeoutError(
+        f"{' '.join(map(str, cmd_input['command'][:2]))} was killed after "
+        f"{timeout:g} s."
+    )
+
+
+def _outfiles(cmd_input: Dict[str, Any], scratch: str) -> Dict[str, str]:
+    outfiles = {}
+    for name in cmd_input.get("outfiles_track") or cmd_input.get("outfiles") or []:
+        path = os.path.join(scratch, name)
+        if os.path.exists(path):
+            outfiles[name] = path
+    return outfiles
+
+
+def _run_streaming(cmd_input: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Blocking counterpart of :func:`run_command_async`, used when stderr has
+    to be passed to ``cmd_input["stderr_callback"]`` while the command runs.
+    """
+    callback, timeout = cmd_input["stderr_callback"], cmd_input.get("timeout")
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    scratch = tempfile.mkdtemp(dir=cmd_input.get("scratch_directory"))
+    try:
+        proc = subprocess.Popen(
+            cmd_input["command"],
+            cwd=scratch,
+            env=cmd_input.get("environment"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        stdout, stderr, expired = [], [], threading.Event()
+
+        def expire():
+            expired.set()
+            proc.kill()
+
+        reader = threading.Thread(target=lambda: stdout.append(proc.stdout.read()))
+        killer = threading.Timer(timeout, expire) if timeout else None
+        reader.start()
+        try:
+            if killer:
+                killer.start()
+            for chunk in iter(lambda: proc.stderr.read1(65536), b""):
+                stderr.append(chunk)
+                callback(decoder.decode(chunk))
+            proc.wait()
+        finally:
+            if killer:
+                killer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            reader.join()
+            proc.stdout.close()
+            proc.stderr.close()
+        if expired.is_set():
+            raise _timed_out(cmd_input, timeout)
+        output = {
+            "stdout": b"".join(stdout).decode(errors="replace"),
+            "stderr": b"".join(stderr).decode(errors="replace"),
+            "returncode": proc.returncode,
+            "scratch_directory": scratch,
+            "outfiles": _outfiles(cmd_input, scratch),
+        }
+        _check(cmd_input, output)
+    except BaseException:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+
+    return output
+
+
+def run_command(cmd_input: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs a CmdComponent input dict and returns the output as a dict. An
+    optional ``timeout`` entry (s) kills the command once it expires and
+    raises TimeoutError. An optional ``stderr_callback`` entry is called
+    with the stderr text as it is written; an exception it raises kills
+    the command and propagates. A command that fails raises RuntimeError
+    with the end of its stderr.
+    """
+    if cmd_input.get("stderr_callback"):
+        return _run_streaming(cmd_input)
+
+    from mmic_cmd.components import CmdComponent
+
+    cmd_input = dict(cmd_input)
+    cmd_input.pop("stderr_callback", None)
+    timeout = cmd_input.pop("timeout", None)
+    if timeout is None:
+        output = CmdComponent.compute(cmd_input).dict()
+        _check(cmd_input, output)
+        return output
+
+    start = time.monotonic()
+    success, output = CmdComponent(name=CmdComponent.__name__).execute(
+        cmd_input, timeout=timeout
+    )
+    output = output.dict()
+    missing = set(cmd_input.get("outfiles_track") or []) - set(output["outfiles"])
+    if missing and time.monotonic() - start >= timeout:
+        raise _timed_out(cmd_input, timeout)
+    _check(cmd_input, output, success)
+    return output
+
+
+async def _read(
+    stream: asyncio.StreamReader, callback: Optional[Callable[[str], Any]] = None
+) -> bytes:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunks = []
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+        if callback:
+            callback(decoder.decode(chunk))
+
+
+async def run_command_async(cmd_input: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Runs a CmdComponent input dict with ``asyncio.create_subprocess_exec``
+    in a new scratch directory and returns a dict shaped like the
+    CmdComponent output: stdout, stderr, returncode, scratch_directory
+    and outfiles, mapping each tracked file name to its path. Cancelling
+    the task, or the expiry of an optional ``timeout`` entry (s), kills the
+    process and removes the scratch directory. Timeouts raise TimeoutError
+    and failed commands RuntimeError. An optional ``stderr_callback``
+    entry is called with the stderr text as it is written, see
+    :func:`run_command`.
+    """
+    scratch = tempfile.mkdtemp(dir=cmd_input.get("scratch_directory"))
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd_input["command"],
+            cwd=scratch,
+            env=cmd_input.get("environment"),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr, _ = await asyncio.wait_for(
+                asyncio.gather(
+                    _read(proc.stdout),
+                    _read(proc.stderr, cmd_input.get("stderr_callback")),
+                    proc.wait(),
+                ),
+                cmd_input.get("timeout"),
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise _timed_out(cmd_input, cmd_input["timeout"])
+        except BaseException:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        output = {
+            "stdout": stdout.decode(errors="replace"),
+            "stderr": stderr.decode(errors="replace"),
+            "returncode": proc.returncode,
+            "scratch_directory": scratch,
+            "outfiles": _outfiles(cmd_input, scratch),
+        }
+        _check(cmd_input, output)
+    except BaseException:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+
+    return output
+
+
+async def _gather(aws: List[Awaitable[Any]]) -> List[Any]:
+    """Like ``asyncio.gather`` but cancels the other awaitables on failure."""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def drive(
+    steps: Steps, run: Callable[[Dict[str, Any]], Dict[str, Any]] = run_command
+) -> Any:
+    """
+    Runs the commands of a stage with the blocking ``run``, those yielded
+    in a list in one thread each. An exception of a command is raised in
+    the stage at its yield, which may handle it e.g. to recover from a
+    TimeoutError.
+    """
+    try:
+        cmd_input = next(steps)
+        while True:
+            try:
+                if isinstance(cmd_input, list):
+                    with ThreadPoolExecutor(max(1, len(cmd_input))) as pool:
+                        output = list(pool.map(run, cmd_input))
+                else:
+                    output = run(cmd_input)
+            except Exception as exc:
+                cmd_input = steps.throw(exc)
+            else:
+                cmd_input = steps.send(output)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        steps.close()
+
+
+async def drive_async(
+    steps: Steps,
+    run: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]] = run_command_async,
+) -> Any:
+    """
+    Runs the commands of a stage with the coroutine ``run``, those yielded
+    in a list concurrently. Exceptions of commands are raised in the stage
+    as in :func:`drive`. If the task is cancelled the stage is closed, so
+    its cleanup code runs.
+    """
+    try:
+        cmd_input = next(steps)
+        while True:
+            try:
+                if isinstance(cmd_input, list):
+                    output = await _gather([run(cmd) for cmd in cmd_input])
+                else:
+                    output = await run(cmd_input)
+            except Exception as exc:
+                cmd_input = steps.throw(exc)
+            else:
+                cmd_input = steps.send(output)
+    except StopIteration as stop:
+        return stop.value
+    finally:
+        steps.close()
@@ -0,0 +1,74 @@
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from .hardware import available_cores
+
+__all__ = ["system_size", "threads_per_run", "run_scheduled"]
+
+# Atoms per thread below which extra threads in one mdrun stop paying off.
+# PME systems have mesh work to share, vacuum systems only pair forces.
+# Provisional estimates, not measured: tune them with
+# devtools/scripts/bench_scheduler.py.
+_atoms_per_thread = {True: 1000, False: 2000}
+
+
+def system_size(inputs: "OptimInput") -> int:
+    """Returns the total number of atoms of all molecules in ``inputs``."""
+    return sum(len(mol.symbols) for mol in inputs.molecule.values())
+
+
+def threads_per_run(inputs: "OptimInput", ncores: int) -> int:
+    """
+    Picks the number of threads for one minimization from its atom count
+    and boundary conditions: one thread per ~1000 atoms for periodic
+    systems and ~2000 otherwise (provisional values), rounded down to a
+    power of two and capped by ``ncores``. Small molecules get a single
+    thread, so many of them run side by side instead.
+    """
+    periodic = "periodic" in (inputs.boundary or ())
+    threads = system_size(inputs) // _atoms_per_thread[periodic]
+    threads = 1 << max(0, threads.bit_length() - 1)
+    return max(1, min(threads, ncores))
+
+
+def run_scheduled(
+    executor: Executor,
+    func: Callable[..., Any],
+    jobs: Sequence[Any],
+    configs: Sequence[Dict[str, Any]],
+    ncores: Optional[int] = None,
+    **kwargs,
+) -> List[Future]:
+    """
+    Submits ``func(job, config=config, **kwargs)`` for every job and its
+    TaskConfig-like dict such that the ``config["ncores"]`` of the running
+    jobs never add up to more than ``ncores``. Larger jobs are started
+    first and smaller ones fill the remaining cores. A job needing more
+    than ``ncores`` runs alone.
+
+    Returns
+    -------
+    List[Future]
+        Futures in the order of ``jobs``, all completed.
+    """
+    ncores = ncores or available_cores()
+    threads = [config.get("ncores") or 1 for config in configs]
+    pending = sorted(range(len(jobs)), key=lambda i: -threads[i])
+    futures: Dict[int, Future] = {}
+    running: Dict[Future, int] = {}
+    free = ncores
+
+    while pending or running:
+        for i in list(pending):
+            if threads[i] <= free or free == ncores:
+                future = executor.submit(func, jobs[i], config=configs[i], **kwargs)
+                futures[i], running[future] = future, threads[i]
+                free -= threads[i]
+                pending.remove(i)
+            if free <= 0:
+                break
+
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            free += running.pop(future)
+
+    return [futures[i] for i in range(len(jobs))]
@@ -0,0 +1,420 @@
+from typing import Any, Dict, List, Optional, Sequence, TextIO, Tuple, Union
+from .gro import residue_arrays, atom_names
+from .units import unit_scale
+from .cache import FileCache, _canonical
+import json
+import numpy
+
+__all__ = ["write_top", "write_system_top", "moleculetype_keys"]
+
+_comb_rules = {"lorentz-berthelot": 2, "geometric": 3}
+_chunk_size = 2 ** 16
+
+
+def _header(nbody: int, *params: str) -> str:
+    atoms = ("ai", "aj", "ak", "al")[:nbody]
+    return ";" + " ".join(f"{col:>6s}" for col in atoms + ("funct",) + params)
+
+
+def _write_section(
+    fp: TextIO,
+    name: str,
+    header: str,
+    fmts: List[str],
+    columns: List[numpy.ndarray],
+):
+    """
+    Writes a ``[ name ]`` section whose rows are built column-wise with
+    NumPy, ``_chunk_size`` rows at a time to bound the memory used.
+    """
+    fp.write(f"[ {name} ]\n{header}\n")
+    nrows = len(columns[0]) if columns else 0
+    for start in range(0, nrows, _chunk_size):
+        stop = start + _chunk_size
+        lines = numpy.char.mod(fmts[0], columns[0][start:stop])
+        for fmt, col in zip(fmts[1:], columns[1:]):
+            lines = numpy.char.add(lines, numpy.char.mod(fmt, col[start:stop]))
+        fp.write("\n".join(lines.tolist()))
+        fp.write("\n")
+    fp.write("\n")
+
+
+def _single(params: Any, kind: str) -> Any:
+    if isinstance(params, list):
+        if len(params) != 1:
+            raise NotImplementedError(f"Multiple {kind} models are not supported.")
+        return params[0]
+    return params
+
+
+def _indices(connectivity: List[Tuple], nbody: int) -> numpy.ndarray:
+    """Returns the (n, nbody) array of 1-based atom indices."""
+    conn = numpy.asarray([item[:nbody] for item in connectivity])
+    if conn.dtype.kind not in "iu":
+        raise NotImplementedError("Only index-based connectivity is supported.")
+    return conn.astype(int) + 1
+
+
+def _atom_params(ff: "ForceField") -> List[numpy.ndarray]:
+    """Returns the per-atom type name, mass, sigma (nm) and epsilon (kJ/mol)."""
+    nonbonded = _single(ff.nonbonded, "nonbonded")
+    if nonbonded is None or nonbonded.form != "LennardJones":
+        raise NotImplementedError("Only Lennard-Jones nonbonded models are supported.")
+    if ff.masses is None:
+        raise NotImplementedError("Atomic masses must be defined in the force field.")
+
+    lj = nonbonded.params
+    sigma = lj.sigma / unit_scale("nm", lj.sigma_units)
+    epsilon = lj.epsilon * unit_scale(lj.epsilon_units, "kJ/mol")
+    masses = ff.masses * unit_scale(ff.masses_units, "amu")
+    names = numpy.asarray(ff.defs if ff.defs is not None else ff.symbols, dtype=str)
+    return [names, masses, sigma, epsilon]
+
+
+def atom_types(
+    ff: Union["ForceField", Sequence["ForceField"]]
+) -> Tuple[numpy.ndarray, Dict[str, numpy.ndarray]]:
+    """
+    Returns the per-atom type names of ``ff`` and the table of unique
+    atom types (name, mass, sigma in nm, epsilon in kJ/mol). Atoms that
+    share a definition but not its nonbonded parameters get distinct names.
+    For several force fields the table is shared and the type names of
+    their atoms are concatenated.
+    """
+    ffs = ff if isinstance(ff, (list, tuple)) else [ff]
+    params = [_atom_params(ff) for ff in ffs]
+    names, masses, sigma, epsilon = (
+        numpy.concatenate([param[i] for param in params]) for i in range(4)
+    )
+
+    keys = numpy.rec.fromarrays([names, masses, sigma, epsilon])
+    uniq, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+
+    # Rename types whose definition is reused with different parameters
+    type_names = names[first].astype(object)
+    seen = {}
+    for i, name in enumerate(type_names):
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        if count:
+            type_names[i] = f"{name}_{count}"
+
+    table = {
+        "name": type_names.astype(str),
+        "mass": masses[first],
+        "sigma": sigma[first],
+        "epsilon": epsilon[first],
+    }
+    return table["name"][inverse.ravel()], table
+
+
+def _write_header(
+    fp: TextIO, ffs: Sequence["ForceField"], table: Dict[str, numpy.ndarray]
+):
+    rules = {
+        (
+            _single(ff.nonbonded, "nonbonded").combination_rule or "lorentz-berthelot"
+        ).lower()
+        for ff in ffs
+    }
+    rule = rules.pop()
+    if rules:
+        raise NotImplementedError("Force fields must share the combination rule.")
+    if rule not in _comb_rules:
+        raise NotImplementedError(f"Combination rule {rule} is not supported.")
+
+    ff = ffs[0]  # [ defaults ] applies to the whole system
+
+    extras = ff.extras or {}
+    fudge_lj, fudge_qq = extras.get("fudgeLJ", 1.0), extras.get("fudgeQQ", 1.0)
+
+    fp.write("; Topology written by mmic_optim_gmx\n\n")
+    _write_section(
+        fp,
+        "defaults",
+        "; nbfunc        comb-rule       gen-pairs       fudgeLJ fudgeQQ",
+        ["%-15d ", "%-15d ", "%-15s ", "%-12.8g ", "%-12.8g"],
+        [numpy.array([1]), numpy.array([_comb_rules[rule]]), numpy.array(["yes"])]
+        + [numpy.array([fudge_lj]), numpy.array([fudge_qq])],
+    )
+    ntypes = len(table["name"])
+    _write_section(
+        fp,
+        "atomtypes",
+        "; name      mass    charge ptype  sigma      epsilon",
+        ["%-10s ", "%10.6f  ", "%10.8f  ", "%s ", "%14.8g ", "%14.8g"],
+        [
+            table["name"],
+            table["mass"],
+            numpy.zeros(ntypes),
+            numpy.full(ntypes, "A"),
+            table["sigma"],
+            table["epsilon"],
+        ],
+    )
+
+
+def _bond_columns(ff: "ForceField") -> Optional[Tuple[str, List[str], List]]:
+    bonds = _single(ff.bonds, "bond")
+    if bonds is None:
+        return None
+
+    funct = {"Harmonic": 1, "Gromos96": 2}.get(bonds.form)
+    if funct is None:
+        raise NotImplementedError(f"Bond form {bonds.form} is not supported.")
+    to_units = "kJ/(mol*nm**2)" if funct == 1 else "kJ/(mol*nm**4)"
+
+    idx = _indices(bonds.connectivity, 2)
+    lengths = bonds.lengths / unit_scale("nm", bonds.lengths_units)
+    spring = bonds.params.spring * unit_scale(bonds.params.spring_units, to_units)
+    return (
+        _header(2, "b0", "kb"),
+        ["%7d ", "%6d ", "%5d   ", "%.5f ", "%f"],
+        [idx[:, 0], idx[:, 1], numpy.full(len(idx), funct), lengths, spring],
+    )
+
+
+def _angle_columns(ff: "ForceField") -> Optional[Tuple[str, List[str], List]]:
+    angles = _single(ff.angles, "angle")
+    if angles is None:
+        return None
+    if angles.form != "Harmonic":
+        raise NotImplementedError(f"Angle form {angles.form} is not supported.")
+
+    idx = _indices(angles.connectivity, 3)
+    theta = angles.angles * unit_scale(angles.angles_units, "degrees")
+    spring = angles.params.spring * unit_scale(
+        angles.params.spring_units, "kJ/(mol*radian**2)"
+    )
+    return (
+        _header(3, "theta0", "ktheta"),
+        ["%7d ", "%6d ", "%6d ", "%5d   ", "%.7f ", "%f"],
+        [idx[:, 0], idx[:, 1], idx[:, 2], numpy.full(len(idx), 1), theta, spring],
+    )
+
+
+def _dihedral_columns(dihedrals: Any, funct: int) -> Tuple[str, List[str], List]:
+    """Periodic (Charmm-style) proper or improper dihedral rows."""
+    idx = _indices(dihedrals.connectivity, 4)
+    params = dihedrals.params
+
+    if dihedrals.form == "Charmm":
+        energy, phase, per = params.energy, params.phase, params.periodicity
+    elif dihedrals.form == "CharmmMulti" and funct == 9:
+        # One row per term, repeating the atom indices of each dihedral
+        nterms = numpy.array([len(term) for term in params.energy])
+        idx = numpy.repeat(idx, nterms, axis=0)
+        energy = numpy.concatenate(params.energy)
+        phase = numpy.concatenate(params.phase)
+        per = numpy.concatenate(params.periodicity)
+    else:
+        raise NotImplementedError(f"Dihedral form {dihedrals.form} is not supported.")
+
+    energy = energy * unit_scale(params.energy_units, "kJ/mol")
+    phase = phase * unit_scale(params.phase_units, "degrees")
+    return (
+        _header(4, "phase", "kd", "pn"),
+        ["%7d ", "%6d ", "%6d ", "%6d ", "%5d  ", "%.7f  ", "%.7f  ", "%d"],
+        [idx[:, 0], idx[:, 1], idx[:, 2], idx[:, 3]]
+        + [numpy.full(len(idx), funct), phase, energy, per],
+    )
+
+
+def _pair_columns(
+    ff: "ForceField", natoms: int
+) -> Optional[Tuple[str, List[str], List]]:
+    """
+    1-4 pairs from the proper dihedrals, excluding atoms that are
+    already 1-2 or 1-3 neighbors (e.g. in rings).
+    """
+    dihedrals = _single(ff.dihedrals, "dihedral")
+    if dihedrals is None:
+        return None
+
+    def encode(i, j):
+        return numpy.minimum(i, j) * (natoms + 1) + numpy.maximum(i, j)
+
+    idx = _indices(dihedrals.connectivity, 4)
+    pairs = numpy.unique(encode(idx[:, 0], idx[:, 3]))
+
+    close = []
+    if ff.bonds is not None:
+        bidx = _indices(_single(ff.bonds, "bond").connectivity, 2)
+        close.append(encode(bidx[:, 0], bidx[:, 1]))
+    if ff.angles is not None:
+        aidx = _indices(_single(ff.angles, "angle").connectivity, 3)
+        close.append(encode(aidx[:, 0], aidx[:, 2]))
+    if close:
+        pairs = numpy.setdiff1d(pairs, numpy.concatenate(close))
+    pairs = pairs[pairs // (natoms + 1) != pairs % (natoms + 1)]
+
+    return (
+        _header(2),
+        ["%7d ", "%6d ", "%5d"],
+        [pairs // (natoms + 1), pairs % (natoms + 1), numpy.full(len(pairs), 1)],
+    )
+
+
+def write_moleculetype(
+    fp: TextIO,
+    ff: "ForceField",
+    name: str,
+    types: numpy.ndarray,
+    mol: Optional["Molecule"] = None,
+):
+    """
+    Writes the ``[ moleculetype ]`` block of ``ff``: atoms, bonds,
+    pairs, angles and dihedrals, each streamed from the parameter arrays.
+    """
+    natoms = len(ff.symbols)
+    resnames, resids = residue_arrays(mol if mol is not None else ff)
+    names = atom_names(mol) if mol is not None else numpy.asarray(ff.symbols)
+    charges = (
+        ff.charges * unit_scale(ff.charges_units, "e")
+        if ff.charges is not None
+        else numpy.zeros(natoms)
+    )
+    masses = ff.masses * unit_scale(ff.masses_units, "amu")
+    nr = numpy.arange(1, natoms + 1)
+
+    fp.write(f"[ moleculetype ]\n; Name            nrexcl\n{name}          3\n\n")
+    _write_section(
+        fp,
+        "atoms",
+        ";   nr       type  resnr residue  atom   cgnr    charge       mass",
+        ["%5d ", "%10s ", "%6d ", "%6s ", "%6s ", "%6d ", "%10.8f ", "%10.6f"],
+        [nr, types, resids, resnames, names, nr, charges, masses],
+    )
+
+    sections = [("bonds", _bond_columns(ff)), ("pairs", _pair_columns(ff, natoms))]
+    sections.append(("angles", _angle_columns(ff)))
+
+    dihedrals = _single(ff.dihedrals, "dihedral")
+    if dihedrals is not None:
+        sections.append(("dihedrals", _dihedral_columns(dihedrals, 9)))
+    impropers = _single(ff.dihedrals_improper, "improper dihedral")
+    if impropers is not None:
+        sections.append(("dihedrals", _dihedral_columns(impropers, 4)))
+
+    for section, data in sections:
+        if data is not None and len(data[2][0]):
+            _write_section(fp, section, *data)
+
+
+def write_top(
+    ff: "ForceField",
+    filename: str,
+    mol: Optional["Molecule"] = None,
+    name: str = "MOL",
+    title: Optional[str] = None,
+):
+    """
+    Writes a ForceField to a self-contained GROMACS topology without
+    building intermediate per-term Python objects.
+
+    Parameters
+    ----------
+    ff : ForceField
+        Force field with Lennard-Jones nonbonded, harmonic bond/angle
+        and Charmm-style dihedral parameters.
+    filename : str
+        Output .top file.
+    mol : Molecule, optional
+        Molecule providing atom and residue names. Defaults to the
+        force field symbols and substructs.
+    name : str, optional
+        Name of the molecule type.
+    title : str, optional
+        System title. Defaults to the force field name.
+
+    Raises
+    ------
+    NotImplementedError
+        If ``ff`` uses a potential this writer does not support.
+    """
+    write_system_top([ff], filename, mols=[mol], names=[name], title=title)
+
+
+def moleculetype_keys(
+    ffs: Sequence["ForceField"], mols: Optional[Sequence[Optional["Molecule"]]] = None
+) -> List[str]:
+    """
+    Returns a hash per molecule of everything its ``[ moleculetype ]``
+    block is written from: the force field, provenance excluded, and the
+    atom and residue names. Equal keys mean the block can be shared.
+    Each force field object is serialized only once.
+    """
+    mols = mols or [None] * len(ffs)
+    ff_data, keys = {}, []
+    for ff, mol in zip(ffs, mols):
+        if id(ff) not in ff_data:
+            ff_data[id(ff)] = json.dumps(_canonical(ff), sort_keys=True)
+        resnames, resids = residue_arrays(mol if mol is not None else ff)
+        names = atom_names(mol) if mol is not None else numpy.asarray(ff.symbols)
+        keys.append(
+            FileCache.key(
+                ff_data[id(ff)],
+                *("\n".join(map(str, col)) for col in (resnames, resids, names)),
+            )
+        )
+    return keys
+
+
+def write_system_top(
+    ffs: Sequence["ForceField"],
+    filename: str,
+    mols: Optional[Sequence[Optional["Molecule"]]] = None,
+    names: Optional[Sequence[str]] = None,
+    title: Optional[str] = None,
+):
+    """
+    Writes the force fields of several molecules to one topology: a
+    shared atom type table, one ``[ moleculetype ]`` per distinct
+    molecule topology (see :func:`moleculetype_keys`) and a
+    ``[ molecules ]`` section listing the molecules in order with
+    consecutive copies counted, matching a GRO file written with
+    :func:`write_gro` from the same molecules.
+
+    Parameters
+    ----------
+    ffs : Sequence[ForceField]
+        Force fields of the molecules, see :func:`write_top`. The
+        ``[ defaults ]`` are taken from the first one.
+    filename : str
+        Output .top file.
+    mols : Sequence[Molecule], optional
+        Molecules providing atom and residue names.
+    names : Sequence[str], optional
+        Unique molecule names. A shared molecule type is named after its
+        first molecule. Defaults to MOL1, MOL2, ...
+    title : str, optional
+        System title. Defaults to the name of the first force field.
+    """
+    mols = mols or [None] * len(ffs)
+    names = names or [f"MOL{i + 1}" for i in range(len(ffs))]
+
+    # Distinct molecule types, named after their first molecule
+    keys, moltypes = moleculetype_keys(ffs, mols), {}
+    for key, ff, mol, name in zip(keys, ffs, mols, names):
+        moltypes.setdefault(key, (name, ff, mol))
+    uniq = list(moltypes.values())
+    types, table = atom_types([ff for _, ff, _ in uniq])
+    bounds = numpy.cumsum([0] + [len(ff.symbols) for _, ff, _ in uniq])
+
+    # Consecutive copies of a molecule type share a line
+    molecules = []
+    for key in keys:
+        name = moltypes[key][0]
+        if molecules and molecules[-1][0] == name:
+            molecules[-1][1] += 1
+        else:
+            molecules.append([name, 1])
+
+    with open(filename, "w") as fp:
+        _write_header(fp, [ff for _, ff, _ in uniq], table)
+        for i, (name, ff, mol) in enumerate(uniq):
+            write_moleculetype(fp, ff, name, types[bounds[i] : bounds[i + 1]], mol)
+        fp.write(f"[ system ]\n; Name\n{title or ffs[0].name or 'Generic title'}\n\n")
+        fp.write("[ molecules ]\n; Compound       #mols\n")
+        for name, count in molecules:
+            fp.write(f"{name:<15s} {count:6d}\n")
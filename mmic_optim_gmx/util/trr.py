@@ -0,0 +1,273 @@
+from typing import Dict, Iterator, Optional, Sequence
+from .units import unit_scale
+import numpy
+
+__all__ = ["TrrFile", "select_frames", "read_trajectory", "write_trr"]
+
+_magic = 1993
+_version = b"GMX_trn_file"
+_int = numpy.dtype(">i4")
+# Header ints following the version string, in file order
+_sizes = (
+    "ir_size",
+    "e_size",
+    "box_size",
+    "vir_size",
+    "pres_size",
+    "top_size",
+    "sym_size",
+    "x_size",
+    "v_size",
+    "f_size",
+    "natoms",
+    "step",
+    "nre",
+)
+# Trajectory model default units for the TRR (nm, ps) fields
+_units = {
+    "x": ("nm", "angstrom"),
+    "v": ("nm/ps", "angstrom/fs"),
+    "f": ("kJ/(mol*nm)", "kJ/(mol*angstrom)"),
+}
+
+
+def select_frames(
+    nframes: int, stride: Optional[int] = None, last: Optional[int] = None
+) -> numpy.ndarray:
+    """
+    Returns the indices of every ``stride``-th frame out of ``nframes``,
+    keeping only the last ``last`` of those when given.
+    """
+    frames = numpy.arange(nframes)[:: stride or 1]
+    if last is not None:
+        frames = frames[len(frames) - min(last, len(frames)) :]
+    return frames
+
+
+class TrrFile:
+    """
+    Random-access reader for GROMACS .trr files. Only the frame headers
+    are read on construction; coordinates, velocities and forces are read
+    from disk on demand, one frame at a time.
+
+    Parameters
+    ----------
+    filename : str
+        Input .trr file.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._index = self._build_index()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, frame: int) -> Dict[str, numpy.ndarray]:
+        return self.read_frame(frame)
+
+    def __iter__(self) -> Iterator[Dict[str, numpy.ndarray]]:
+        return self.iter_frames()
+
+    @property
+    def natoms(self) -> int:
+        return self._index[0]["natoms"] if self._index else 0
+
+    @property
+    def steps(self) -> numpy.ndarray:
+        return numpy.array([frame["step"] for frame in self._index], dtype=int)
+
+    @property
+    def times(self) -> numpy.ndarray:
+        return numpy.array([frame["time"] for frame in self._index], dtype=float)
+
+    def has_field(self, frame: int, name: str) -> bool:
+        """Returns True if ``frame`` stores ``name`` e.g. "x", "v" or "f"."""
+        return name in self._index[frame]["blocks"]
+
+    def _build_index(self):
+        index = []
+        with open(self.filename, "rb") as fp:
+            size = fp.seek(0, 2)
+            fp.seek(0)
+            while True:
+                start = fp.tell()
+                head = fp.read(8)
+                if len(head) < 8:
+                    break
+                magic, _ = numpy.frombuffer(head, _int)
+                if magic != _magic:
+                    raise ValueError(f"{self.filename} is not a valid trr file.")
+
+                # XDR string: length int, then chars padded to 4 bytes
+                (nchars,) = numpy.frombuffer(fp.read(4), _int)
+                fp.seek(-(-nchars // 4) * 4, 1)
+
+                header = dict(zip(_sizes, numpy.fromfile(fp, _int, len(_sizes))))
+                natoms = int(header["natoms"])
+                data_size = header["box_size"] or header["x_size"] or header["v_size"]
+                data_size = data_size or header["f_size"]
+                nreal = 9 if header["box_size"] else 3 * natoms
+                real = numpy.dtype(">f8" if data_size == 8 * nreal else ">f4")
+                (time, _) = numpy.fromfile(fp, real, 2)
+
+                # Record where each block starts and skip over the data
+                offset, blocks = fp.tell(), {}
+                offset += header["ir_size"] + header["e_size"]
+                for name in ("box", "vir", "pres"):
+                    if header[f"{name}_size"]:
+                        blocks[name] = offset
+                    offset += header[f"{name}_size"]
+                offset += header["top_size"] + header["sym_size"]
+                for name in ("x", "v", "f"):
+                    if header[f"{name}_size"]:
+                        blocks[name] = offset
+                    offset += header[f"{name}_size"]
+
+                if offset > size:
+                    break  # truncated last frame e.g. from a killed run
+                fp.seek(offset)
+                index.append(
+                    {
+                        "start": start,
+                        "natoms": natoms,
+                        "step": int(header["step"]),
+                        "time": float(time),
+                        "dtype": real,
+                        "blocks": blocks,
+                    }
+                )
+        return index
+
+    def read_frame(
+        self, frame: int, fields: Sequence[str] = ("box", "x", "v", "f")
+    ) -> Dict[str, numpy.ndarray]:
+        """
+        Reads ``fields`` of a single frame as float64 arrays in GROMACS
+        units. The box is (3, 3), the rest (natoms, 3). Fields absent
+        from the frame are omitted.
+        """
+        with open(self.filename, "rb") as fp:
+            return self._read(fp, frame, fields)
+
+    def _read(self, fp, frame: int, fields: Sequence[str]) -> Dict[str, numpy.ndarray]:
+        meta = self._index[frame]
+        shapes = {"box": (3, 3), "vir": (3, 3), "pres": (3, 3)}
+        data = {"step": meta["step"], "time": meta["time"]}
+        for name in fields:
+            if name not in meta["blocks"]:
+                continue
+            shape = shapes.get(name, (meta["natoms"], 3))
+            fp.seek(meta["blocks"][name])
+            values = numpy.fromfile(fp, meta["dtype"], shape[0] * shape[1])
+            data[name] = values.reshape(shape).astype(float)
+        return data
+
+    def iter_frames(
+        self,
+        frames: Optional[Sequence[int]] = None,
+        fields: Sequence[str] = ("box", "x", "v", "f"),
+    ) -> Iterator[Dict[str, numpy.ndarray]]:
+        """Yields the requested frames (all by default) one at a time."""
+        with open(self.filename, "rb") as fp:
+            for frame in range(len(self)) if frames is None else frames:
+                yield self._read(fp, frame, fields)
+
+
+def read_trajectory(
+    filename: str,
+    stride: Optional[int] = None,
+    last: Optional[int] = None,
+    **kwargs,
+) -> "Trajectory":
+    """
+    Reads a .trr file into a Trajectory holding only the selected frames
+    (see :func:`select_frames`), so memory scales with the number of kept
+    frames rather than the length of the run. Velocities and forces are
+    included when every selected frame has them. Keyword arguments are
+    passed to the Trajectory model.
+    """
+    from mmelemental.models import Trajectory
+
+    trr = TrrFile(filename)
+    frames = select_frames(len(trr), stride, last)
+    natoms, nframes = trr.natoms, len(frames)
+
+    # Only allocate the fields that every selected frame has
+    names = [
+        name
+        for name in ("x", "v", "f")
+        if nframes and all(trr.has_field(frame, name) for frame in frames)
+    ]
+    arrays = {name: numpy.empty((nframes, natoms, 3)) for name in names}
+    for i, data in enumerate(trr.iter_frames(frames, fields=names)):
+        for name in names:
+            arrays[name][i] = data[name]
+
+    fields = {}
+    for name, key in zip(("x", "v", "f"), ("geometry", "velocities", "forces")):
+        if name in arrays:
+            from_units, to_units = _units[name]
+            values = arrays.pop(name)
+            values *= unit_scale(from_units, to_units)
+            fields[key] = values.ravel()
+            fields[f"{key}_units"] = to_units
+
+    times, steps = trr.times[frames], trr.steps[frames]
+    extras = {"steps": steps, "times": times, "frames": frames}
+    extras.update(kwargs.pop("extras", {}))
+    return Trajectory(
+        natoms=natoms,
+        nframes=nframes,
+        timestep=float(times[1] - times[0]) if nframes > 1 else 0.0,
+        timestep_units="ps",
+        extras=extras,
+        **fields,
+        **kwargs,
+    )
+
+
+def write_trr(
+    filename: str, coords: numpy.ndarray, box: Optional[numpy.ndarray] = None
+):
+    """
+    Writes single precision .trr frames holding only coordinates and the
+    box, e.g. the frames of ``mdrun -rerun``. Frame i gets step i and
+    time i ps.
+
+    Parameters
+    ----------
+    filename : str
+        Output .trr file.
+    coords : numpy.ndarray
+        Coordinates (nframes, natoms, 3) in nm.
+    box : numpy.ndarray, optional
+        Box vectors (3, 3) in nm shared by all frames, or (nframes, 3, 3).
+    """
+    real = numpy.dtype(">f4")
+    coords = numpy.asarray(coords, dtype=float)
+    coords = coords.reshape(len(coords), -1, 3)
+    nframes, natoms = coords.shape[:2]
+    if box is not None:
+        box = numpy.broadcast_to(
+            numpy.asarray(box, dtype=float).reshape(-1, 3, 3), (nframes, 3, 3)
+        )
+
+    header = dict.fromkeys(_sizes, 0)
+    header.update(
+        box_size=0 if box is None else 9 * real.itemsize,
+        x_size=3 * natoms * real.itemsize,
+        natoms=natoms,
+    )
+    # XDR string: length int, then chars padded to 4 bytes
+    version = _version + b"\0" * (-len(_version) % 4)
+    with open(filename, "wb") as fp:
+        for frame in range(nframes):
+            header["step"] = frame
+            fp.write(numpy.array([_magic, len(_version) + 1, len(_version)], _int))
+            fp.write(version)
+            fp.write(numpy.array([header[name] for name in _sizes], _int))
+            fp.write(numpy.array([frame, 0.0], real))  # time and lambda
+            if box is not None:
+                fp.write(box[frame].astype(real))
+            fp.write(coords[frame].astype(real))
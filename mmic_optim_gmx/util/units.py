@@ -0,0 +1,14 @@
+from functools import lru_cache
+
+__all__ = ["unit_scale"]
+
+
+@lru_cache(maxsize=None)
+def unit_scale(from_units: str, to_units: str) -> float:
+    """Returns the factor converting ``from_units`` to ``to_units``."""
+    if from_units == to_units:
+        return 1.0
+
+    from mmelemental.util.units import convert
+
+    return float(convert(1.0, from_units, to_units))